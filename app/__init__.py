@@ -1,17 +1,39 @@
 from flask import Flask
 from .config import Config
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bootstrap import Bootstrap
+from .database import DatabaseProfile, SQLAlchemy
+from .last_seen import LastSeenBuffer
+from .notify import NotificationHub
+from .passwords import PasswordHasher
+from .fragments import FragmentCache
+from .metrics import RequestMetrics
+from .tag_index import TagIndex
+from .jobs import JobQueue
+from .user_cache import UserCache
 
 app = Flask(__name__)
 app.config.from_object(Config)
-db = SQLAlchemy(app)
+if app.config['LOG_LEVEL']:
+	app.logger.setLevel(app.config['LOG_LEVEL'].upper())
+database_profile = DatabaseProfile(app)
+request_metrics = RequestMetrics(app)
+db = SQLAlchemy(app, attach=[database_profile.attach, request_metrics.attach])
 migrate = Migrate(app, db)
 login = LoginManager(app)
 login.login_view = 'login'
 login.login_message = ''
 bootstrap = Bootstrap(app)
+last_seen = LastSeenBuffer(app, db)
+notification_hub = NotificationHub()
+password_hasher = PasswordHasher(app)
+fragment_cache = FragmentCache(app)
+request_metrics.add_collector('collabnow_fragment_cache', fragment_cache.stats)
+tag_index = TagIndex(app)
+jobs = JobQueue(app, db)
+request_metrics.add_collector('collabnow_jobs', jobs.stats)
+user_cache = UserCache(app, db)
+request_metrics.add_collector('collabnow_user_cache', user_cache.stats)
 
-from app import routes, models, errors
+from app import routes, models, errors, cli
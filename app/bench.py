@@ -0,0 +1,236 @@
+import json
+import os
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from time import perf_counter, time
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from werkzeug.security import generate_password_hash
+from app import app, db, jobs, last_seen
+from app.models import User, Listing, ListingTag, Message, Notification
+from app.models import listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc
+from app.passwords import PasswordHasher
+from app.search import create_index
+
+#Benchmarks run against a scratch SQLite file so they never touch the application database
+
+def scratch_engine(path):
+	engine = create_engine('sqlite:///' + path, connect_args={'timeout': 30})
+	db.metadata.create_all(engine)
+	return engine
+
+def legacy_notification_write(Session, user_id, name, payload_json):
+	#The original add_notification: filtered DELETE followed by an ORM INSERT
+	session = Session()
+	try:
+		session.query(Notification).filter_by(user_id=user_id, name=name).delete()
+		session.add(Notification(user_id=user_id, name=name, payload_json=payload_json, timestamp=time()))
+		session.commit()
+	finally:
+		session.close()
+
+def upsert_notification_write(engine, user_id, name, payload_json):
+	with engine.begin() as connection:
+		Notification.upsert(connection, engine.dialect, user_id, name, payload_json, time())
+
+def run_senders(senders, writes, write):
+	errors = []
+	def sender(number):
+		for i in range(writes):
+			try:
+				write(number, i)
+			except Exception as e:
+				errors.append(repr(e))
+	threads = [threading.Thread(target=sender, args=(number,)) for number in range(senders)]
+	start = perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = perf_counter() - start
+	return {
+		'writes': senders * writes,
+		'seconds': round(elapsed, 4),
+		'writes_per_second': round(senders * writes / elapsed, 1),
+		'errors': len(errors),
+	}
+
+def notification_writes(senders, writes, recipients):
+	fd, path = tempfile.mkstemp(suffix='.db')
+	os.close(fd)
+	try:
+		engine = scratch_engine(path)
+		engine.execute(User.__table__.insert(), [
+			{'username': 'bench{}'.format(i), 'email': 'bench{}@example.com'.format(i)} for i in range(recipients)])
+		Session = sessionmaker(bind=engine)
+		legacy = run_senders(senders, writes, lambda number, i: legacy_notification_write(
+			Session, (number + i) % recipients + 1, 'unread_message_count', json.dumps(i)))
+		upsert = run_senders(senders, writes, lambda number, i: upsert_notification_write(
+			engine, (number + i) % recipients + 1, 'unread_message_count', json.dumps(i)))
+		engine.dispose()
+		return {'senders': senders, 'recipients': recipients, 'delete_insert': legacy, 'upsert': upsert}
+	finally:
+		os.remove(path)
+
+def password_checks(hasher, threads, logins):
+	password_hash = hasher.generate('correct horse battery staple')
+	result = run_senders(threads, logins, lambda number, i: hasher.check(password_hash, 'correct horse battery staple'))
+	return {
+		'logins': result['writes'],
+		'seconds': result['seconds'],
+		'logins_per_second': result['writes_per_second'],
+		'errors': result['errors'],
+	}
+
+def login_throughput(threads, logins, workers):
+	results = {'threads': threads}
+	for name, pool_size in (('inline', 0), ('pool', workers)):
+		hasher = PasswordHasher()
+		hasher.configure(dict(app.config, PASSWORD_HASH_WORKERS=pool_size))
+		try:
+			results[name] = password_checks(hasher, threads, logins)
+		finally:
+			hasher.shutdown()
+	results['pool']['workers'] = workers
+	return results
+
+def use_scratch_database(path):
+	#Points the application at a scratch SQLite file. Must run before anything opens the real database.
+	app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+	app.config['WTF_CSRF_ENABLED'] = False
+	if db.engine.url.database != path:
+		raise RuntimeError('the application database is already open, refusing to benchmark against it')
+	db.create_all()
+
+def zipf_weights(n, s=1.1):
+	return [1.0 / rank ** s for rank in range(1, n + 1)]
+
+def sample_distinct(rng, population, weights, k):
+	k = min(k, len(population))
+	chosen = []
+	while len(chosen) < k:
+		for item in rng.choices(population, weights, k=k - len(chosen)):
+			if item not in chosen:
+				chosen.append(item)
+	return chosen
+
+def seed(volumes, random_seed=0):
+	#Fills the scratch database with Core executemany batches. Tag popularity and message recipients
+	#follow a Zipf distribution, so a few tags and users are hot and most of the tail is cold.
+	rng = random.Random(random_seed)
+	now = datetime.utcnow()
+	def moment():
+		return now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+	password_hash = generate_password_hash('bench')
+	user_ids = list(range(1, volumes['users'] + 1))
+	tag_ids = list(range(1, volumes['tags'] + 1))
+	listing_ids = list(range(1, volumes['listings'] + 1))
+	tag_weights = zipf_weights(len(tag_ids))
+	user_weights = zipf_weights(len(user_ids))
+	with db.engine.begin() as connection:
+		connection.execute(User.__table__.insert(), [{
+			'id': id, 'username': 'user{}'.format(id), 'email': 'user{}@example.com'.format(id),
+			'avatar_digest': User.email_digest('user{}@example.com'.format(id)),
+			'password_hash': password_hash, 'major': rng.choice(['', 'CS', 'Math', 'Art', 'Biology']),
+			'last_seen': moment()} for id in user_ids])
+		connection.execute(ListingTag.__table__.insert(), [
+			{'id': id, 'tag': 'tag{}'.format(id)} for id in tag_ids])
+		listings, tags, members, interested = [], [], [], []
+		for id in listing_ids:
+			owner = rng.choice(user_ids)
+			listings.append({
+				'id': id, 'title': 'Project {} {}'.format(id, rng.choice(['app', 'robot', 'paper', 'game', 'survey'])),
+				'body': 'Looking for people to build a {} with'.format(rng.choice(['website', 'model', 'report', 'prototype'])),
+				'desired_size': rng.randint(2, 8), 'timestamp': moment(), 'user_id': owner,
+				'is_complete': rng.random() < 0.3, 'card_version': 0})
+			for tag_id in sample_distinct(rng, tag_ids, tag_weights, rng.randint(1, volumes['tags_per_listing'])):
+				tags.append({'listing_id': id, 'tag_id': tag_id})
+			joined = [owner] + rng.sample(user_ids, min(rng.randint(0, volumes['members']), len(user_ids)))
+			for user_id in set(joined):
+				members.append({'listing_id': id, 'user_id': user_id})
+			for user_id in set(rng.sample(user_ids, min(rng.randint(0, volumes['interested']), len(user_ids)))) - set(joined):
+				interested.append({'listing_id': id, 'user_id': user_id})
+		connection.execute(Listing.__table__.insert(), listings)
+		connection.execute(listing_tag_assoc.insert(), tags)
+		connection.execute(listing_user_assoc.insert(), members)
+		if interested:
+			connection.execute(listing_interested_user_assoc.insert(), interested)
+		messages = [{
+			'sender_id': rng.choice(user_ids), 'recipient_id': rng.choices(user_ids, user_weights)[0],
+			'body': 'Message {}'.format(i), 'timestamp': moment()} for i in range(volumes['messages'])]
+		if messages:
+			connection.execute(Message.__table__.insert(), messages)
+		notifications = [{
+			'user_id': user_id, 'name': 'unread_message_count', 'payload_json': json.dumps(rng.randint(0, 9)),
+			'timestamp': time() - rng.randint(0, 3600)} for user_id in user_ids[:volumes['notifications']]]
+		if notifications:
+			connection.execute(Notification.__table__.insert(), notifications)
+		create_index(connection, Listing)
+	User.recompute_unread_counts()
+	return {'user': user_ids[0], 'popular_tags': ['tag1', 'tag2'], 'listing': listing_ids[0],
+		'deep_page': max(1, volumes['listings'] // app.config['LISTINGS_PER_PAGE'] // 2)}
+
+def percentile(values, p):
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+
+def time_routes(routes, email, requests):
+	statements = []
+	def count(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+	event.listen(db.engine, 'before_cursor_execute', count)
+	client = app.test_client()
+	client.post('/login', data={'email': email, 'password': 'bench'})
+	results = {}
+	try:
+		for name, url in routes:
+			client.get(url)
+			latencies, counts = [], []
+			for _ in range(requests):
+				del statements[:]
+				start = perf_counter()
+				response = client.get(url)
+				latencies.append((perf_counter() - start) * 1000)
+				counts.append(len(statements))
+			results[name] = {
+				'url': url,
+				'status': response.status_code,
+				'p50_ms': round(percentile(latencies, 50), 3),
+				'p95_ms': round(percentile(latencies, 95), 3),
+				'p99_ms': round(percentile(latencies, 99), 3),
+				'statements': max(counts),
+			}
+	finally:
+		event.remove(db.engine, 'before_cursor_execute', count)
+	return results
+
+def route_latency(volumes, requests, path=None, random_seed=0):
+	scratch = path is None
+	if scratch:
+		fd, path = tempfile.mkstemp(suffix='.db')
+		os.close(fd)
+	try:
+		use_scratch_database(path)
+		sample = seed(volumes, random_seed)
+		user = 'user{}'.format(sample['user'])
+		email = '{}@example.com'.format(user)
+		routes = [
+			('index', '/index'),
+			('index_deep_page', '/index?page={}'.format(sample['deep_page'])),
+			('index_tags', '/index?tags={}'.format('%23'.join(sample['popular_tags']))),
+			('index_title', '/index?title=robot'),
+			('user', '/user/{}'.format(user)),
+			('view_listing', '/view_listing/{}'.format(sample['listing'])),
+			('messages', '/messages'),
+			('notifications', '/notifications?since=0'),
+		]
+		return {'volumes': volumes, 'requests': requests, 'routes': time_routes(routes, email, requests)}
+	finally:
+		jobs.stop()
+		last_seen.flush()
+		if scratch:
+			db.session.remove()
+			db.engine.dispose()
+			os.remove(path)
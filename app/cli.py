@@ -0,0 +1,149 @@
+import json
+import os
+import click
+from app import app, db, database_profile, jobs
+from app.models import User
+
+@app.cli.command('repair-unread')
+def repair_unread():
+	"""Recompute every user's unread message counter."""
+	User.recompute_unread_counts()
+
+@app.cli.command()
+@click.option('--all', 'everyone', is_flag=True, help='Rebuild every user, not only those whose memberships changed.')
+@click.option('--batch-size', default=512, help='Users scored per matrix batch.')
+def recommend(everyone, batch_size):
+	"""Rebuild the precomputed listing recommendations."""
+	from app.recommend import rebuild
+	count = rebuild(everyone, app.config['RECOMMENDATIONS_PER_USER'], batch_size)
+	click.echo('Rebuilt recommendations for {} users'.format(count))
+
+@app.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=500, help='Rows validated and written per transaction.')
+@click.option('--checkpoint', default=None, help='Progress file, PATH.checkpoint by default.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first line.')
+def import_rows(path, chunk_size, checkpoint, restart):
+	"""Bulk load users, listings and tags from a JSONL file."""
+	from app.importer import run_import
+	echo = lambda message: click.echo(message, err=True)
+	totals = run_import(path, chunk_size, checkpoint, restart, echo)
+	click.echo('Imported {users} users, {listings} listings and {tags} tags, rejected {rejected} lines'.format(**totals))
+
+@app.cli.command()
+@click.argument('kind', type=click.Choice(['listings', 'messages', 'members']))
+@click.option('--output', default=None, help='Write to this file, resuming an interrupted export. Defaults to stdout.')
+@click.option('--since', default=None, help='Only rows at or after this time, YYYY-MM-DD[THH:MM:SS].')
+@click.option('--until', default=None, help='Only rows before this time.')
+@click.option('--after', default=0, help='Only rows after this id (listing id for members).')
+@click.option('--batch-size', default=None, type=int, help='Rows read per query.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress for --output.')
+def export(kind, output, since, until, after, batch_size, restart):
+	"""Stream listings, messages or memberships as NDJSON."""
+	from app.export import ndjson, export_to_file, parse_time
+	try:
+		since, until = parse_time(since), parse_time(until)
+	except ValueError as e:
+		raise click.BadParameter(str(e))
+	batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+	if output is None:
+		for chunk in ndjson(kind, since, until, after, batch_size):
+			click.echo(chunk, nl=False)
+		return
+	try:
+		written = export_to_file(kind, output, since, until, after, batch_size, restart)
+	except ValueError as e:
+		raise click.ClickException(str(e))
+	click.echo('Wrote {} rows to {}'.format(written, output), err=True)
+
+@app.cli.group('jobs')
+def jobs_group():
+	"""Inspect and run the background job outbox."""
+	pass
+
+@jobs_group.command()
+def run():
+	"""Run every due job in the foreground, then exit."""
+	click.echo('Ran {} jobs'.format(jobs.drain()))
+
+@jobs_group.command()
+def status():
+	"""Show how many jobs are pending, running and dead."""
+	for state, count in jobs.stats().items():
+		click.echo('{}: {}'.format(state, count))
+
+@jobs_group.command('retry-dead')
+def retry_dead():
+	"""Queue dead jobs again with a fresh attempt count."""
+	click.echo('Requeued {} jobs'.format(jobs.retry_dead()))
+
+@app.cli.command('db-profile')
+def db_profile():
+	"""Show the database settings in effect on a live connection."""
+	with db.engine.connect() as connection:
+		for name, value in database_profile.active_settings(connection).items():
+			click.echo('{}: {}'.format(name, value))
+
+@app.cli.group()
+def bench():
+	"""Performance benchmarks, run against a scratch database."""
+	pass
+
+def volume_options(command):
+	options = [
+		click.option('--users', default=500, help='Users to create.'),
+		click.option('--listings', default=2000, help='Listings to create.'),
+		click.option('--tags', default=200, help='Distinct tags, drawn with Zipf popularity.'),
+		click.option('--tags-per-listing', default=5, help='Most tags on one listing.'),
+		click.option('--members', default=4, help='Most extra members on one listing.'),
+		click.option('--interested', default=3, help='Most interested users on one listing.'),
+		click.option('--messages', default=10000, help='Private messages to create.'),
+		click.option('--notifications', default=500, help='Users with a stored notification.'),
+		click.option('--seed', 'random_seed', default=0, help='Random seed, for repeatable data.'),
+	]
+	for option in reversed(options):
+		command = option(command)
+	return command
+
+def volumes_from(options):
+	names = ['users', 'listings', 'tags', 'tags_per_listing', 'members', 'interested', 'messages', 'notifications']
+	return {name: options[name] for name in names}
+
+@bench.command()
+@click.argument('database')
+@volume_options
+def seed(database, random_seed, **options):
+	"""Fill a new scratch SQLite file with synthetic data."""
+	from app.bench import use_scratch_database, seed
+	use_scratch_database(os.path.abspath(database))
+	seed(volumes_from(options), random_seed)
+
+@bench.command()
+@click.option('--requests', default=50, help='Timed requests per route.')
+@click.option('--database', default=None, help='Keep the scratch database at this path.')
+@click.option('--output', type=click.File('w'), default='-', help='Write the JSON report here.')
+@volume_options
+def routes(requests, database, output, random_seed, **options):
+	"""Seed a scratch database and report route latency and SQL statement counts."""
+	from app.bench import route_latency
+	path = os.path.abspath(database) if database else None
+	report = route_latency(volumes_from(options), requests, path, random_seed)
+	output.write(json.dumps(report, indent=2) + '\n')
+
+@bench.command()
+@click.option('--senders', default=16, help='Concurrent sender threads.')
+@click.option('--writes', default=50, help='Notification writes per sender.')
+@click.option('--recipients', default=8, help='Distinct users receiving notifications.')
+def notifications(senders, writes, recipients):
+	"""Compare delete+insert and upsert notification writes."""
+	from app.bench import notification_writes
+	click.echo(json.dumps(notification_writes(senders, writes, recipients), indent=2))
+
+@bench.command()
+@click.option('--threads', default=8, help='Concurrent request threads.')
+@click.option('--logins', default=10, help='Logins per thread.')
+@click.option('--workers', default=2, help='Hashing pool processes.')
+def logins(threads, logins, workers):
+	"""Compare password check throughput inline and through the hashing pool."""
+	from app.bench import login_throughput
+	click.echo(json.dumps(login_throughput(threads, logins, workers), indent=2))
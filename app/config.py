@@ -5,4 +5,46 @@ class Config(object):
 	SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
 	SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
 	SQLALCHEMY_TRACK_MODIFICATIONS = False
-	LISTINGS_PER_PAGE = 6
\ No newline at end of file
+	#Level for app.logger, e.g. INFO in production to log startup settings such as the database profile
+	LOG_LEVEL = os.environ.get('LOG_LEVEL')
+	SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'wal'
+	SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'normal'
+	SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)
+	SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -16000)
+	SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 134217728)
+	DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+	DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+	DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+	DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+	LISTINGS_PER_PAGE = 6
+	LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get('LAST_SEEN_FLUSH_INTERVAL') or 60)
+	LAST_SEEN_FLUSH_THRESHOLD = int(os.environ.get('LAST_SEEN_FLUSH_THRESHOLD') or 100)
+	LAST_SEEN_RESOLUTION = int(os.environ.get('LAST_SEEN_RESOLUTION') or 60)
+	#Each open stream holds a worker for up to NOTIFICATION_STREAM_TIMEOUT seconds, so only turn it on
+	#under a threaded or async server (gunicorn --threads / gevent); otherwise pages keep polling
+	NOTIFICATION_STREAM = (os.environ.get('NOTIFICATION_STREAM') or 'off') != 'off'
+	NOTIFICATION_STREAM_TIMEOUT = int(os.environ.get('NOTIFICATION_STREAM_TIMEOUT') or 300)
+	NOTIFICATION_STREAM_KEEPALIVE = int(os.environ.get('NOTIFICATION_STREAM_KEEPALIVE') or 15)
+	PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:150000'
+	PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH') or 8)
+	PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)
+	PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE') or 32)
+	PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT') or 10)
+	FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 1024)
+	SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET') or 25)
+	SQL_QUERY_BUDGETS = {}
+	METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+	TAG_INDEX_REFRESH = int(os.environ.get('TAG_INDEX_REFRESH') or 300)
+	RECOMMENDATIONS_PER_USER = int(os.environ.get('RECOMMENDATIONS_PER_USER') or 20)
+	EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN')
+	EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 1000)
+	SELECTION_PER_PAGE = int(os.environ.get('SELECTION_PER_PAGE') or 50)
+	JOBS_SYNCHRONOUS = (os.environ.get('JOBS_SYNCHRONOUS') or 'off') != 'off'
+	JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS') or 2)
+	JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE') or 20)
+	JOBS_POLL_INTERVAL = int(os.environ.get('JOBS_POLL_INTERVAL') or 5)
+	JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS') or 5)
+	JOBS_RETRY_DELAY = int(os.environ.get('JOBS_RETRY_DELAY') or 10)
+	JOBS_LEASE = int(os.environ.get('JOBS_LEASE') or 300)
+	USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+	USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 60)
\ No newline at end of file
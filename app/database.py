@@ -0,0 +1,73 @@
+import sqlite3
+import flask_sqlalchemy
+from sqlalchemy import event
+
+class DatabaseProfile(object):
+	#Connection settings for production. SQLite connections get WAL journaling and a busy timeout
+	#so several workers can write without "database is locked"; server databases get pool sizing.
+	def __init__(self, app=None):
+		self.pragmas = []
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.app = app
+		uri = app.config['SQLALCHEMY_DATABASE_URI']
+		self.sqlite = uri.startswith('sqlite')
+		if self.sqlite:
+			self.pragmas = [
+				('journal_mode', app.config['SQLITE_JOURNAL_MODE']),
+				('synchronous', app.config['SQLITE_SYNCHRONOUS']),
+				('busy_timeout', app.config['SQLITE_BUSY_TIMEOUT']),
+				('cache_size', app.config['SQLITE_CACHE_SIZE']),
+				('mmap_size', app.config['SQLITE_MMAP_SIZE']),
+			]
+		else:
+			options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+			options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+			options.setdefault('max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+			options.setdefault('pool_recycle', app.config['DATABASE_POOL_RECYCLE'])
+			options.setdefault('pool_timeout', app.config['DATABASE_POOL_TIMEOUT'])
+			options.setdefault('pool_pre_ping', True)
+		#Shown with LOG_LEVEL=INFO, flask db-profile reads the applied settings back on demand
+		app.logger.info('Database profile: %s', self.describe())
+
+	def attach(self, engine):
+		#Only the application's engines get the pragmas, not Alembic's or the benchmarks' scratch engines
+		if self.sqlite and engine.dialect.name == 'sqlite':
+			event.listen(engine, 'connect', self.on_connect)
+
+	def on_connect(self, dbapi_connection, connection_record):
+		if not isinstance(dbapi_connection, sqlite3.Connection):
+			return
+		cursor = dbapi_connection.cursor()
+		for name, value in self.pragmas:
+			cursor.execute('PRAGMA {} = {}'.format(name, value))
+		cursor.close()
+
+	def describe(self):
+		if self.sqlite:
+			settings = self.pragmas
+		else:
+			options = self.app.config['SQLALCHEMY_ENGINE_OPTIONS']
+			settings = sorted((key, value) for key, value in options.items() if key.startswith(('pool', 'max')))
+		return ', '.join('{}={}'.format(name, value) for name, value in settings)
+
+	def active_settings(self, connection):
+		#Reads the settings back from a live connection, for checking what the database really applied
+		if not self.sqlite:
+			return dict(pool=connection.engine.pool.status())
+		return {name: connection.execute('PRAGMA {}'.format(name)).scalar() for name, _ in self.pragmas}
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+	#Hands each engine Flask-SQLAlchemy creates for the app (one per database URI) to the attach
+	#functions, so engine listeners never reach Alembic's or the benchmarks' scratch engines
+	def __init__(self, app=None, attach=(), **kwargs):
+		self.attach = list(attach)
+		super(SQLAlchemy, self).__init__(app, **kwargs)
+
+	def create_engine(self, sa_url, engine_opts):
+		engine = super(SQLAlchemy, self).create_engine(sa_url, engine_opts)
+		for attach in self.attach:
+			attach(engine)
+		return engine
@@ -0,0 +1,117 @@
+import json
+import os
+from datetime import datetime
+from app import db
+from app.models import Listing, ListingTag, Message, listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc
+
+#NDJSON dumps for analytics. Rows are read in keyset batches (WHERE id > last ORDER BY id LIMIT n),
+#so memory stays at one batch and the last id written is all it takes to carry on after an
+#interruption. Each batch ends its transaction and hands the connection back before it is written
+#out, so no snapshot or pooled connection is held while a slow client reads the stream.
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def parse_time(value):
+	#Accepts 2019-11-02, 2019-11-02T10:30:00 or the full format the export writes
+	if not value:
+		return None
+	for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', TIMESTAMP_FORMAT):
+		try:
+			return datetime.strptime(value, fmt)
+		except ValueError:
+			pass
+	raise ValueError('Invalid time {!r}, expected YYYY-MM-DD[THH:MM:SS[.ffffff]]'.format(value))
+
+def format_time(value):
+	return value.strftime(TIMESTAMP_FORMAT) if value else None
+
+def listing_rows(listings):
+	ids = [listing.id for listing in listings]
+	tags = {}
+	for listing_id, tag in db.session.query(listing_tag_assoc.c.listing_id, ListingTag.tag).join(
+			ListingTag, ListingTag.id == listing_tag_assoc.c.tag_id).filter(listing_tag_assoc.c.listing_id.in_(ids)):
+		tags.setdefault(listing_id, []).append(tag)
+	for listing in listings:
+		yield {'id': listing.id, 'title': listing.title, 'body': listing.body, 'desired_size': listing.desired_size,
+			'timestamp': format_time(listing.timestamp), 'user_id': listing.user_id,
+			'is_complete': bool(listing.is_complete), 'tags': sorted(tags.get(listing.id, []))}
+
+def message_rows(messages):
+	for message in messages:
+		yield {'id': message.id, 'sender_id': message.sender_id, 'recipient_id': message.recipient_id,
+			'body': message.body, 'timestamp': format_time(message.timestamp)}
+
+def member_rows(listings):
+	#One row per membership or join request, batched by listing so the listing id is the checkpoint
+	ids = [listing.id for listing in listings]
+	rows = []
+	for table, role in ((listing_user_assoc, 'member'), (listing_interested_user_assoc, 'interested')):
+		rows.extend((listing_id, user_id, role) for listing_id, user_id in db.session.query(
+			table.c.listing_id, table.c.user_id).filter(table.c.listing_id.in_(ids)))
+	for listing_id, user_id, role in sorted(rows):
+		yield {'listing_id': listing_id, 'user_id': user_id, 'role': role}
+
+#kind: (model batches are read from, row serializer, key column written to each row)
+EXPORTS = {
+	'listings': (Listing, listing_rows, 'id'),
+	'messages': (Message, message_rows, 'id'),
+	'members': (Listing, member_rows, 'listing_id'),
+}
+
+def batches(kind, since=None, until=None, after=0, batch_size=1000):
+	#Yields (rows, last id) per batch, the time range applying to the listing or message timestamp
+	model, serialize, _ = EXPORTS[kind]
+	query = model.query
+	if since is not None:
+		query = query.filter(model.timestamp >= since)
+	if until is not None:
+		query = query.filter(model.timestamp < until)
+	while True:
+		items = query.filter(model.id > after).order_by(model.id).limit(batch_size).all()
+		if not items:
+			return
+		after = items[-1].id
+		rows = list(serialize(items))
+		db.session.close()
+		yield rows, after
+
+def ndjson(kind, since=None, until=None, after=0, batch_size=1000):
+	for rows, _ in batches(kind, since, until, after, batch_size):
+		yield ''.join(json.dumps(row) + '\n' for row in rows)
+
+def read_checkpoint(path):
+	if not os.path.exists(path):
+		return None
+	with open(path) as f:
+		return json.load(f)
+
+def write_checkpoint(path, state):
+	partial = path + '.tmp'
+	with open(partial, 'w') as f:
+		json.dump(state, f)
+	os.replace(partial, path)
+
+def export_to_file(kind, path, since=None, until=None, after=0, batch_size=1000, restart=False):
+	#Appends batches to path and records (last id, file size) after each one. A rerun with the same
+	#filters truncates any partly written batch and continues after the recorded id. Returns rows written.
+	checkpoint = path + '.checkpoint'
+	state = None if restart else read_checkpoint(checkpoint)
+	if state is not None and state['filters'] != [kind, format_time(since), format_time(until)]:
+		raise ValueError('{} belongs to a different export, pass --restart to start over'.format(checkpoint))
+	written = 0
+	with open(path, 'r+' if state is not None else 'w') as f:
+		if state is not None:
+			after = state['after']
+			f.truncate(state['size'])
+			f.seek(state['size'])
+		for rows, last in batches(kind, since, until, after, batch_size):
+			for row in rows:
+				f.write(json.dumps(row) + '\n')
+			f.flush()
+			os.fsync(f.fileno())
+			written += len(rows)
+			write_checkpoint(checkpoint, {'filters': [kind, format_time(since), format_time(until)],
+				'after': last, 'size': f.tell()})
+	if os.path.exists(checkpoint):
+		os.remove(checkpoint)
+	return written
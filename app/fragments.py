@@ -0,0 +1,43 @@
+from flask import render_template
+from jinja2 import Markup
+from app.lru import BoundedLRU
+
+class FragmentCache(object):
+	#Bounded LRU of rendered template fragments. Each entry remembers the version it was rendered
+	#at, and a lookup with a newer version re-renders and replaces it.
+	def __init__(self, app=None):
+		self.entries = BoundedLRU()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.entries.max_size = app.config.get('FRAGMENT_CACHE_SIZE', 1024)
+		app.jinja_env.globals['listing_card'] = self.listing_card
+
+	def get(self, key, version, render):
+		entry = self.entries.get(key, lambda entry: entry[0] == version)
+		if entry is not None:
+			return entry[1]
+		html = render()
+		self.entries.put(key, (version, html))
+		return html
+
+	@staticmethod
+	def listing_key(listing):
+		#SQLite hands a deleted listing's id to the next one, so the creation time is part of the key
+		return ('listing', listing.id, listing.timestamp)
+
+	def listing_card(self, listing):
+		if not self.entries.max_size:
+			return Markup(render_template('_listing.html', listing=listing))
+		return self.get(self.listing_key(listing), listing.card_version,
+			lambda: Markup(render_template('_listing.html', listing=listing)))
+
+	def evict(self, key):
+		self.entries.pop(key)
+
+	def clear(self):
+		self.entries.clear()
+
+	def stats(self):
+		return self.entries.stats()
@@ -0,0 +1,235 @@
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from app import db, password_hasher
+from app.forms import RegistrationForm, CreateListingForm
+from app.models import User, Listing, ListingTag, listing_user_assoc, listing_tag_assoc
+from app.search import add_rows_to_index
+
+#Bulk loader for JSONL files with one object per line, told apart by "type":
+#  {"type": "user", "username": ..., "email": ..., "password": ..., "major": ...}
+#  {"type": "listing", "owner": <username>, "title": ..., "body": ..., "desired_size": ..., "tags": "#a #b"}
+#  {"type": "tag", "tag": ...}
+#Lines are read and written a chunk at a time, so memory use doesn't grow with the file. After each
+#committed chunk the byte offset of the next line is saved, and a rerun continues from there.
+#Listing owners must be created in an earlier line than their listings.
+
+class ImportUserForm(RegistrationForm):
+	#Uniqueness is checked for a whole chunk at once instead of one query per field
+	validate_username = None
+	validate_email = None
+
+class ChunkReport(object):
+	def __init__(self):
+		self.users = 0
+		self.listings = 0
+		self.tags = 0
+		self.rejected = []
+
+	def reject(self, line, message):
+		self.rejected.append((line, message))
+
+def form_data(row):
+	data = MultiDict()
+	for key, value in row.items():
+		if isinstance(value, list):
+			value = ' '.join('#' + str(item).lstrip('#') for item in value)
+		if value is not None:
+			data[key] = str(value)
+	return data
+
+def validate(form_class, line, row, report):
+	form = form_class(formdata=form_data(row), meta={'csrf': False})
+	if form.validate():
+		return form
+	for field, errors in form.errors.items():
+		report.reject(line, '{}: {}'.format(field, '; '.join(errors)))
+	return None
+
+def read_chunks(path, offset, number, chunk_size):
+	#Yields (chunk of (line number, text) pairs, byte offset after the chunk, last line number)
+	with open(path, 'rb') as f:
+		f.seek(offset)
+		chunk = []
+		for raw in f:
+			number += 1
+			offset += len(raw)
+			if raw.strip():
+				chunk.append((number, raw.decode('utf-8')))
+			if len(chunk) >= chunk_size:
+				yield chunk, offset, number
+				chunk = []
+		if chunk:
+			yield chunk, offset, number
+
+def import_users(rows, report):
+	forms = []
+	for line, row in rows:
+		form = validate(ImportUserForm, line, dict(row, password2=row.get('password')), report)
+		if form is not None:
+			forms.append((line, form))
+	if not forms:
+		return
+	usernames = [form.username.data for _, form in forms]
+	emails = [form.email.data for _, form in forms]
+	taken_usernames = set(name for name, in db.session.query(User.username).filter(User.username.in_(usernames)))
+	taken_emails = set(email for email, in db.session.query(User.email).filter(User.email.in_(emails)))
+	accepted = []
+	for line, form in forms:
+		if form.username.data in taken_usernames:
+			report.reject(line, 'username: Please use a different username')
+		elif form.email.data in taken_emails:
+			report.reject(line, 'email: There is already an account registered to the provided email.')
+		else:
+			taken_usernames.add(form.username.data)
+			taken_emails.add(form.email.data)
+			accepted.append(form)
+	if not accepted:
+		return
+	#Keep every hashing pool worker busy instead of hashing one password at a time
+	with ThreadPoolExecutor(max_workers=max(1, password_hasher.workers)) as pool:
+		hashes = list(pool.map(password_hasher.generate, [form.password.data for form in accepted]))
+	now = datetime.utcnow()
+	db.session.execute(User.__table__.insert(), [{
+		'username': form.username.data,
+		'email': form.email.data,
+		'avatar_digest': User.email_digest(form.email.data),
+		'major': form.major.data or '',
+		'password_hash': password_hash,
+		'last_seen': now,
+	} for form, password_hash in zip(accepted, hashes)])
+	report.users += len(accepted)
+
+def import_tags(rows, report):
+	names = []
+	for line, row in rows:
+		parsed = ListingTag.parse('#' + str(row.get('tag') or ''))
+		if len(parsed) != 1 or len(parsed[0]) > 32:
+			report.reject(line, 'tag: Expected a single tag of at most 32 characters')
+		else:
+			names.extend(parsed)
+	if names:
+		ListingTag.resolve(names)
+		report.tags += len(names)
+
+def insert_listings(rows):
+	#Inserts a chunk of listings with one statement and returns their ids in the order of rows
+	table = Listing.__table__
+	connection = db.session.connection()
+	dialect = connection.dialect.name
+	if dialect == 'postgresql':
+		return [id for id, in connection.execute(table.insert().values(rows).returning(table.c.id))]
+	if dialect == 'sqlite':
+		#The executemany holds the write lock until commit and each row takes max(rowid) + 1, so the
+		#chunk's ids are the contiguous range ending at last_insert_rowid()
+		connection.execute(table.insert(), rows)
+		last = connection.execute('SELECT last_insert_rowid()').scalar()
+		return list(range(last - len(rows) + 1, last + 1))
+	#Elsewhere ids from a multi-row insert need not be contiguous (MySQL's interleaved
+	#auto-increment mode), so each row is inserted on its own to read back its id
+	return [connection.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+
+def import_listings(rows, report):
+	forms = []
+	for line, row in rows:
+		form = validate(CreateListingForm, line, row, report)
+		if form is not None:
+			forms.append((line, str(row.get('owner') or ''), form))
+	if not forms:
+		return
+	owners = dict(db.session.query(User.username, User.id).filter(
+		User.username.in_(set(owner for _, owner, _ in forms))))
+	accepted = []
+	for line, owner, form in forms:
+		tags = ListingTag.parse(form.tags.data)
+		if owner not in owners:
+			report.reject(line, 'owner: No user named {!r}'.format(owner))
+		elif any(len(tag) > 32 for tag in tags):
+			report.reject(line, 'tags: Tags can be at most 32 characters')
+		else:
+			accepted.append((owners[owner], form, tags))
+	if not accepted:
+		return
+	tag_ids = {tag.tag: tag.id for tag in ListingTag.resolve(
+		[name for _, _, tags in accepted for name in tags])}
+	now = datetime.utcnow()
+	listing_ids = insert_listings([{
+		'title': form.title.data,
+		'body': form.body.data,
+		'desired_size': form.desired_size.data,
+		'user_id': user_id,
+		'timestamp': now,
+	} for user_id, form, _ in accepted])
+	db.session.execute(listing_user_assoc.insert(), [{'listing_id': listing_id, 'user_id': user_id}
+		for listing_id, (user_id, _, _) in zip(listing_ids, accepted)])
+	tag_rows = [{'listing_id': listing_id, 'tag_id': tag_ids[name]}
+		for listing_id, (_, _, tags) in zip(listing_ids, accepted) for name in tags]
+	if tag_rows:
+		db.session.execute(listing_tag_assoc.insert(), tag_rows)
+	add_rows_to_index(db.session.connection(), Listing, listing_ids)
+	#Applied to the suggestion index by the after_commit hook, like Listing.set_tags
+	db.session.info.setdefault('tag_changes', []).extend((name, 1) for _, _, tags in accepted for name in tags)
+	report.listings += len(accepted)
+
+IMPORTERS = OrderedDict([('user', import_users), ('tag', import_tags), ('listing', import_listings)])
+
+def import_chunk(chunk, report):
+	rows = dict((kind, []) for kind in IMPORTERS)
+	for line, text in chunk:
+		try:
+			row = json.loads(text)
+		except ValueError as e:
+			report.reject(line, 'Invalid JSON: {}'.format(e))
+			continue
+		kind = row.get('type') if isinstance(row, dict) else None
+		if kind not in rows:
+			report.reject(line, 'type: Expected one of {}'.format(', '.join(IMPORTERS)))
+			continue
+		rows[kind].append((line, row))
+	#Users first so listings in the same chunk can name them as owners
+	for kind, importer in IMPORTERS.items():
+		if rows[kind]:
+			importer(rows[kind], report)
+
+def read_checkpoint(path):
+	if not os.path.exists(path):
+		return 0, 0
+	with open(path) as f:
+		checkpoint = json.load(f)
+	return checkpoint['offset'], checkpoint['line']
+
+def write_checkpoint(path, offset, line):
+	partial = path + '.tmp'
+	with open(partial, 'w') as f:
+		json.dump({'offset': offset, 'line': line}, f)
+	os.replace(partial, path)
+
+def run_import(path, chunk_size=500, checkpoint=None, restart=False, echo=print):
+	#Each chunk is committed on its own, so a failure loses at most the chunk being written
+	checkpoint = checkpoint or path + '.checkpoint'
+	offset, line = (0, 0) if restart else read_checkpoint(checkpoint)
+	if offset:
+		echo('Resuming {} after line {}'.format(path, line))
+	totals = dict(users=0, listings=0, tags=0, rejected=0)
+	for chunk, offset, line in read_chunks(path, offset, line, chunk_size):
+		report = ChunkReport()
+		try:
+			import_chunk(chunk, report)
+			db.session.commit()
+		except Exception:
+			db.session.rollback()
+			raise
+		write_checkpoint(checkpoint, offset, line)
+		for rejected_line, message in sorted(report.rejected):
+			echo('line {}: {}'.format(rejected_line, message))
+		totals['users'] += report.users
+		totals['listings'] += report.listings
+		totals['tags'] += report.tags
+		totals['rejected'] += len(report.rejected)
+		echo('Committed through line {}'.format(line))
+	if os.path.exists(checkpoint):
+		os.remove(checkpoint)
+	return totals
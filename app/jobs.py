@@ -0,0 +1,164 @@
+import atexit
+import json
+import threading
+import traceback
+import uuid
+from time import time
+
+class JobQueue(object):
+	#Background side effects through a durable outbox. enqueue() adds a row to the job table in the
+	#caller's transaction, so a job exists exactly when the change that caused it was committed and
+	#survives restarts. Worker threads claim due jobs in batches, run each in its own transaction
+	#together with deleting its row, and retry failures with exponential backoff until
+	#JOBS_MAX_ATTEMPTS, after which the row is kept as dead for inspection.
+	#With JOBS_SYNCHRONOUS handlers run inline inside enqueue(), which is what the tests use.
+	def __init__(self, app=None, db=None):
+		self.db = db
+		self.handlers = {}
+		self.lock = threading.Lock()
+		self.wakeup = threading.Event()
+		self.stopping = False
+		self.threads = []
+		if app is not None:
+			self.init_app(app, db)
+
+	def init_app(self, app, db=None):
+		self.app = app
+		self.db = db or self.db
+		self.workers = app.config.get('JOBS_WORKERS', 2)
+		self.batch_size = app.config.get('JOBS_BATCH_SIZE', 20)
+		self.poll_interval = app.config.get('JOBS_POLL_INTERVAL', 5)
+		self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', 5)
+		self.retry_delay = app.config.get('JOBS_RETRY_DELAY', 10)
+		self.lease = app.config.get('JOBS_LEASE', 300)
+		app.before_first_request(self.start)
+		self.db.event.listen(self.db.session, 'after_commit', self.committed)
+		atexit.register(self.stop)
+
+	def handler(self, name):
+		#Registers the function run for jobs called name, like LoginManager.user_loader
+		def register(function):
+			self.handlers[name] = function
+			return function
+		return register
+
+	@property
+	def synchronous(self):
+		return self.app.config.get('JOBS_SYNCHRONOUS', False)
+
+	def enqueue(self, name, **payload):
+		if name not in self.handlers:
+			raise KeyError('No job handler registered for {!r}'.format(name))
+		if self.synchronous:
+			return self.handlers[name](**payload)
+		now = time()
+		self.db.session.execute(self.table.insert().values(name=name, payload_json=json.dumps(payload),
+			status='pending', attempts=0, run_after=now, created=now))
+		self.db.session.info['jobs_enqueued'] = True
+
+	@property
+	def table(self):
+		return self.db.metadata.tables['job']
+
+	def committed(self, session):
+		#Wake the workers as soon as new jobs are visible instead of waiting for the next poll
+		if session.info.pop('jobs_enqueued', False):
+			self.wakeup.set()
+
+	def start(self):
+		with self.lock:
+			if self.synchronous or self.threads or not self.workers:
+				return
+			self.stopping = False
+			for i in range(self.workers):
+				thread = threading.Thread(target=self.work, name='job-worker-{}'.format(i), daemon=True)
+				thread.start()
+				self.threads.append(thread)
+
+	def stop(self):
+		with self.lock:
+			threads, self.threads = self.threads, []
+			self.stopping = True
+		self.wakeup.set()
+		for thread in threads:
+			thread.join(timeout=5)
+
+	def work(self):
+		with self.app.app_context():
+			while not self.stopping:
+				try:
+					processed = self.run_batch()
+				except Exception:
+					self.app.logger.exception('Job worker failed to run a batch')
+					processed = 0
+				finally:
+					self.db.session.remove()
+				if not processed:
+					self.wakeup.wait(self.poll_interval)
+					self.wakeup.clear()
+
+	def claim(self):
+		#A conditional UPDATE stamps up to batch_size due jobs with a fresh token, so concurrent workers
+		#in any process never claim the same row. The UPDATE repeats the due condition: under READ
+		#COMMITTED a worker that picked the same ids re-checks each row once the first claim commits,
+		#and skips it. Jobs whose worker died are reclaimed after the lease.
+		table = self.table
+		db = self.db
+		now = time()
+		token = uuid.uuid4().hex
+		due = db.or_(
+			db.and_(table.c.status == 'pending', table.c.run_after <= now),
+			db.and_(table.c.status == 'running', table.c.claimed_at < now - self.lease))
+		batch = db.select([table.c.id]).where(due).order_by(table.c.id).limit(self.batch_size)
+		db.session.execute(table.update().where(db.and_(table.c.id.in_(batch.alias().select()), due)).values(
+			status='running', claimed_by=token, claimed_at=now))
+		db.session.commit()
+		return db.session.execute(table.select().where(table.c.claimed_by == token).order_by(table.c.id)).fetchall()
+
+	def run_batch(self):
+		#Returns how many jobs were attempted
+		jobs = self.claim()
+		for job in jobs:
+			self.run(job)
+		return len(jobs)
+
+	def run(self, job):
+		table = self.table
+		session = self.db.session
+		try:
+			self.handlers[job.name](**json.loads(job.payload_json))
+			session.execute(table.delete().where(table.c.id == job.id))
+			session.commit()
+		except Exception:
+			session.rollback()
+			attempts = job.attempts + 1
+			dead = attempts >= self.max_attempts or job.name not in self.handlers
+			self.app.logger.warning('Job %s (%s) failed, attempt %d%s', job.id, job.name, attempts,
+				', moved to dead letters' if dead else '')
+			session.execute(table.update().where(table.c.id == job.id).values(
+				status='dead' if dead else 'pending', attempts=attempts, claimed_by=None,
+				run_after=time() + self.retry_delay * 2 ** (attempts - 1), last_error=traceback.format_exc()))
+			session.commit()
+
+	def drain(self):
+		#Runs every due job in the calling thread, for the CLI. Returns how many were attempted.
+		total = 0
+		while True:
+			processed = self.run_batch()
+			if not processed:
+				return total
+			total += processed
+
+	def retry_dead(self):
+		#Puts dead jobs back in the queue with a fresh attempt count, returns how many
+		table = self.table
+		count = self.db.session.execute(table.update().where(table.c.status == 'dead').values(
+			status='pending', attempts=0, run_after=time(), claimed_by=None)).rowcount
+		self.db.session.commit()
+		return count
+
+	def stats(self):
+		table = self.table
+		counts = dict(self.db.session.execute(self.db.select([table.c.status, self.db.func.count()]).group_by(
+			table.c.status)).fetchall())
+		return {status: counts.get(status, 0) for status in ('pending', 'running', 'dead')}
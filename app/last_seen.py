@@ -0,0 +1,76 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+from sqlalchemy import bindparam
+
+class LastSeenBuffer(object):
+	#Collects last_seen timestamps in memory and writes them out in one batched UPDATE,
+	#so authenticated requests no longer each need their own commit. A request flushes once the
+	#buffer reaches the threshold; a daemon thread flushes whatever is left every interval, so
+	#timestamps don't wait for the next request when traffic stops. Writes are best effort: a
+	#failed flush is logged and its timestamps are kept for the next one.
+	def __init__(self, app=None, db=None):
+		self.app = app
+		self.db = db
+		self.pending = {}
+		self.lock = threading.Lock()
+		self.last_flush = monotonic()
+		self.timer = None
+		self.stopping = threading.Event()
+		if app is not None:
+			self.init_app(app, db)
+
+	def init_app(self, app, db=None):
+		self.app = app
+		self.db = db or self.db
+		self.interval = app.config.get('LAST_SEEN_FLUSH_INTERVAL', 60)
+		self.threshold = app.config.get('LAST_SEEN_FLUSH_THRESHOLD', 100)
+		self.resolution = timedelta(seconds=app.config.get('LAST_SEEN_RESOLUTION', 60))
+		atexit.register(self.stop)
+
+	def record(self, user, now=None):
+		now = now or datetime.utcnow()
+		if user.last_seen is not None and now - user.last_seen < self.resolution:
+			return
+		with self.lock:
+			previous = self.pending.get(user.id)
+			if previous is not None and now - previous < self.resolution:
+				return
+			self.pending[user.id] = now
+			due = len(self.pending) >= self.threshold or monotonic() - self.last_flush >= self.interval
+			if self.timer is None:
+				#Started on first use so CLI commands and migrations never get the thread
+				self.timer = threading.Thread(target=self.run_timer, name='last-seen-flush', daemon=True)
+				self.timer.start()
+		if due:
+			self.flush()
+
+	def run_timer(self):
+		while not self.stopping.wait(self.interval):
+			with self.app.app_context():
+				self.flush()
+
+	def stop(self):
+		self.stopping.set()
+		self.flush()
+
+	def flush(self):
+		with self.lock:
+			pending, self.pending = self.pending, {}
+			self.last_flush = monotonic()
+		if not pending:
+			return
+		table = self.db.metadata.tables['user']
+		statement = table.update().where(table.c.id == bindparam('user_id')).values(last_seen=bindparam('seen'))
+		try:
+			with self.db.engine.begin() as connection:
+				connection.execute(statement, [{'user_id': user_id, 'seen': seen} for user_id, seen in pending.items()])
+		except Exception:
+			#Runs inside requests, so a locked database must not turn the page into an error.
+			#Keep the timestamps for the next flush rather than dropping them.
+			self.app.logger.warning('Could not write %d last_seen timestamps, retrying on the next flush',
+				len(pending), exc_info=True)
+			with self.lock:
+				for user_id, seen in pending.items():
+					self.pending[user_id] = max(seen, self.pending.get(user_id, seen))
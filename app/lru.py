@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+class BoundedLRU(object):
+	#Thread safe map holding at most max_size entries, dropping the least recently used first,
+	#with the hit and miss counters the caches report through the metrics collectors
+	def __init__(self, max_size=1024):
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.max_size = max_size
+
+	def get(self, key, valid=None):
+		#Returns None on a miss. An entry that valid(value) rejects counts as a miss and is kept
+		#until the caller replaces it.
+		with self.lock:
+			value = self.entries.get(key)
+			if value is not None and (valid is None or valid(value)):
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return value
+			self.misses += 1
+			return None
+
+	def put(self, key, value):
+		with self.lock:
+			self.entries[key] = value
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_size:
+				self.entries.popitem(last=False)
+
+	def pop(self, key):
+		with self.lock:
+			return self.entries.pop(key, None)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		with self.lock:
+			total = self.hits + self.misses
+			return {
+				'size': len(self.entries),
+				'max_size': self.max_size,
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_rate': self.hits / total if total else 0.0,
+			}
@@ -0,0 +1,117 @@
+import threading
+from time import perf_counter
+from flask import g, request, has_app_context
+from sqlalchemy import event
+
+#Upper bounds in seconds, the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+class EndpointStats(object):
+	def __init__(self):
+		self.requests = {}
+		self.buckets = [0] * len(BUCKETS)
+		self.count = 0
+		self.duration = 0.0
+		self.statements = 0
+		self.sql_duration = 0.0
+
+	def observe(self, method, status, duration, statements, sql_duration):
+		key = (method, status)
+		self.requests[key] = self.requests.get(key, 0) + 1
+		for i, bound in enumerate(BUCKETS):
+			if duration <= bound:
+				self.buckets[i] += 1
+		self.count += 1
+		self.duration += duration
+		self.statements += statements
+		self.sql_duration += sql_duration
+
+class RequestMetrics(object):
+	#Per-endpoint request counts, latency histograms and SQL statement counts/time, collected from
+	#Flask request hooks and SQLAlchemy cursor events and rendered in the Prometheus text format
+	def __init__(self, app=None):
+		self.lock = threading.Lock()
+		self.endpoints = {}
+		self.collectors = []
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.app = app
+		self.default_budget = app.config.get('SQL_QUERY_BUDGET', 0)
+		self.budgets = app.config.get('SQL_QUERY_BUDGETS', {})
+		app.before_request(self.start_request)
+		app.after_request(self.finish_request)
+
+	def attach(self, engine):
+		#Called for the app's engines by app.database.SQLAlchemy
+		event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+		event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+	def add_collector(self, prefix, stats):
+		#stats() returns a dict of numbers, exported as <prefix>_<key> gauges
+		self.collectors.append((prefix, stats))
+
+	def start_request(self):
+		g.metrics_start = perf_counter()
+		g.sql_statements = 0
+		g.sql_duration = 0.0
+
+	def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		if has_app_context() and 'metrics_start' in g:
+			g.sql_started = perf_counter()
+
+	def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		if has_app_context() and 'sql_started' in g:
+			g.sql_statements += 1
+			g.sql_duration += perf_counter() - g.pop('sql_started')
+
+	def finish_request(self, response):
+		if 'metrics_start' not in g:
+			return response
+		duration = perf_counter() - g.metrics_start
+		endpoint = request.endpoint or 'unmatched'
+		with self.lock:
+			stats = self.endpoints.setdefault(endpoint, EndpointStats())
+			stats.observe(request.method, response.status_code, duration, g.sql_statements, g.sql_duration)
+		response.headers.add('Server-Timing', 'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+			duration * 1000, g.sql_duration * 1000, g.sql_statements))
+		budget = self.budgets.get(endpoint, self.default_budget)
+		if budget and g.sql_statements > budget:
+			self.app.logger.warning('%s issued %d SQL statements, over its budget of %d',
+				endpoint, g.sql_statements, budget)
+		return response
+
+	def render(self):
+		lines = []
+		def metric(name, kind, help):
+			lines.append('# HELP {} {}'.format(name, help))
+			lines.append('# TYPE {} {}'.format(name, kind))
+		with self.lock:
+			endpoints = sorted(self.endpoints.items())
+			metric('collabnow_requests_total', 'counter', 'Requests handled, by endpoint, method and status.')
+			for endpoint, stats in endpoints:
+				for (method, status), count in sorted(stats.requests.items()):
+					lines.append('collabnow_requests_total{{endpoint="{}",method="{}",status="{}"}} {}'.format(
+						endpoint, method, status, count))
+			metric('collabnow_request_duration_seconds', 'histogram', 'Time spent handling requests.')
+			for endpoint, stats in endpoints:
+				for bound, count in zip(BUCKETS, stats.buckets):
+					lines.append('collabnow_request_duration_seconds_bucket{{endpoint="{}",le="{}"}} {}'.format(
+						endpoint, bound, count))
+				lines.append('collabnow_request_duration_seconds_bucket{{endpoint="{}",le="+Inf"}} {}'.format(
+					endpoint, stats.count))
+				lines.append('collabnow_request_duration_seconds_sum{{endpoint="{}"}} {}'.format(endpoint, stats.duration))
+				lines.append('collabnow_request_duration_seconds_count{{endpoint="{}"}} {}'.format(endpoint, stats.count))
+			metric('collabnow_sql_statements_total', 'counter', 'SQL statements issued while handling requests.')
+			for endpoint, stats in endpoints:
+				lines.append('collabnow_sql_statements_total{{endpoint="{}"}} {}'.format(endpoint, stats.statements))
+			metric('collabnow_sql_duration_seconds_total', 'counter', 'Time spent in SQL while handling requests.')
+			for endpoint, stats in endpoints:
+				lines.append('collabnow_sql_duration_seconds_total{{endpoint="{}"}} {}'.format(endpoint, stats.sql_duration))
+		for prefix, stats in self.collectors:
+			for key, value in sorted(stats().items()):
+				name = '{}_{}'.format(prefix, key)
+				metric(name, 'gauge', '{} {}'.format(prefix.replace('_', ' '), key.replace('_', ' ')))
+				lines.append('{} {}'.format(name, value))
+		return '\n'.join(lines) + '\n'
@@ -1,26 +1,81 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from datetime import datetime
 from app import db
 from app import login
+from app import notification_hub
+from app import password_hasher
+from app import tag_index
+from app import fragment_cache
+from app import jobs
+from app import user_cache
 from hashlib import md5
+from flask import g, has_app_context
 import json
 from time import time
+from collections import OrderedDict
+from sqlalchemy.dialects import postgresql, mysql
+from sqlalchemy.exc import IntegrityError
+from flask_sqlalchemy import Pagination
+from app.search import index_name, fts_available, match_expression, add_to_index, remove_from_index, query_index
+
+class SearchableMixin(object):
+	@classmethod
+	def search(cls, expression, page, per_page, query=None):
+		query = query or cls.query
+		index = index_name(cls)
+		if not fts_available(index) or not match_expression(expression):
+			return query.filter(cls.title.contains(expression)).order_by(
+				cls.timestamp.desc()).paginate(page, per_page, False)
+		ids, total = query_index(index, expression, page, per_page)
+		items = []
+		if ids:
+			when = [(ids[i], i) for i in range(len(ids))]
+			items = query.filter(cls.id.in_(ids)).order_by(db.case(when, value=cls.id)).all()
+		return Pagination(None, page, per_page, total, items)
+
+	@classmethod
+	def after_flush(cls, session, flush_context):
+		connection = session.connection()
+		for obj in session.new:
+			if isinstance(obj, SearchableMixin):
+				add_to_index(connection, index_name(obj), obj)
+		for obj in session.dirty:
+			if isinstance(obj, SearchableMixin) and obj.search_fields_changed():
+				add_to_index(connection, index_name(obj), obj)
+		for obj in session.deleted:
+			if isinstance(obj, SearchableMixin):
+				remove_from_index(connection, index_name(obj), obj)
+
+	def search_fields_changed(self):
+		state = db.inspect(self)
+		return any(state.attrs[field].history.has_changes() for field in self.__searchable__)
+
+	@classmethod
+	def reindex(cls):
+		connection = db.session.connection()
+		for obj in cls.query:
+			add_to_index(connection, index_name(cls), obj)
+		db.session.commit()
+
+db.event.listen(db.session, 'after_flush', SearchableMixin.after_flush)
 
 listing_user_assoc = db.Table('listing_user_assoc',
-	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id')),
-	db.Column('user_id', db.Integer, db.ForeignKey('user.id'))
+	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id'), primary_key=True),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+	db.Index('ix_listing_user_assoc_user_id_listing_id', 'user_id', 'listing_id')
 )
 
 listing_interested_user_assoc = db.Table('listing_interested_user_assoc',
-	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id')),
-	db.Column('user_id', db.Integer, db.ForeignKey('user.id'))
+	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id'), primary_key=True),
+	db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+	db.Index('ix_listing_interested_user_assoc_user_id_listing_id', 'user_id', 'listing_id')
 )
 
 class User(UserMixin, db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	username = db.Column(db.String(64), index=True, unique=True)
 	email = db.Column(db.String(120), index=True, unique=True)
+	avatar_digest = db.Column(db.String(32))
 	password_hash = db.Column(db.String(128))
 	major = db.Column(db.String(64), default='')
 	listings = db.relationship('Listing', backref='owner', lazy='dynamic')
@@ -33,39 +88,90 @@ class User(UserMixin, db.Model):
 										foreign_keys='Message.recipient_id',
 										backref='recipient', lazy='dynamic')
 	last_message_read_time = db.Column(db.DateTime)
+	unread_count = db.Column(db.Integer, default=0, server_default='0')
+	recommendations_stale = db.Column(db.Boolean, default=True, server_default=db.true())
 	notifications = db.relationship('Notification', backref='user',
 									lazy='dynamic')
 
 	def set_password(self, password):
-		self.password_hash = generate_password_hash(password)
+		self.password_hash = password_hasher.generate(password)
 
 	def check_password(self, password):
-		return check_password_hash(self.password_hash, password)
+		if not password_hasher.check(self.password_hash, password):
+			return False
+		#Upgrade hashes made with older parameters while the plain password is at hand
+		if password_hasher.needs_rehash(self.password_hash):
+			self.set_password(password)
+		return True
+
+	@staticmethod
+	def email_digest(email):
+		return md5(email.lower().encode('utf-8')).hexdigest()
 
 	def avatar(self, size):
-		digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-		return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(digest, size)
+		#Memoized per request, message and listing pages ask for the same few avatars over and over
+		cache = g.setdefault('avatars', {}) if has_app_context() else {}
+		key = (self.id, size)
+		if key not in cache:
+			digest = self.avatar_digest or User.email_digest(self.email)
+			cache[key] = 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(digest, size)
+		return cache[key]
 
 	def new_messages(self):
-		last_read_time = self.last_message_read_time or datetime(1900, 1, 1)
-		return Message.query.filter_by(recipient=self).filter(
-			Message.timestamp > last_read_time).count()
+		#Pending messages only bump the counter when flushed
+		if db.session.new:
+			db.session.flush()
+		return self.unread_count or 0
+
+	@staticmethod
+	def recompute_unread_counts():
+		#Rebuilds every unread_count from last_message_read_time in one statement
+		last_read_time = db.func.coalesce(User.last_message_read_time, datetime(1900, 1, 1))
+		unread = db.select([db.func.count(Message.id)]).where(db.and_(
+			Message.recipient_id == User.id, Message.timestamp > last_read_time)).as_scalar()
+		db.session.execute(User.__table__.update().values(unread_count=unread))
+		db.session.commit()
+
+	def joined_listings(self):
+		#Listings this user is a member of, joined through the association table and left unloaded
+		return Listing.card_query().join(listing_user_assoc, listing_user_assoc.c.listing_id == Listing.id).filter(
+			listing_user_assoc.c.user_id == self.id)
+
+	def project_counts(self):
+		#(current, completed) joined listings from a single aggregate query
+		total, completed = db.session.query(db.func.count(), db.func.sum(db.case(
+			[(Listing.is_complete == True, 1)], else_=0))).select_from(listing_user_assoc).join(
+			Listing, Listing.id == listing_user_assoc.c.listing_id).filter(
+			listing_user_assoc.c.user_id == self.id).one()
+		completed = completed or 0
+		return total - completed, completed
 
 	def add_notification(self, name, data):
-		self.notifications.filter_by(name=name).delete()
-		n = Notification(name=name, payload_json=json.dumps(data), user=self)
-		db.session.add(n)
+		n = {'name': name, 'data': data, 'timestamp': time()}
+		Notification.upsert(db.session, db.session.get_bind().dialect, self.id, name, json.dumps(data), n['timestamp'])
+		db.session.info.setdefault('notifications', []).append((self.id, n))
 		return n
 
 	def __repr__(self):
 		return '<User {}>'.format(self.email)
 
+#Identity columns the user loader serves from memory. unread_count and the other counters change
+#behind the user's back and are loaded on first access instead.
+user_cache.cache(User, ['id', 'username', 'email', 'avatar_digest', 'major', 'about_me', 'last_seen'],
+	watch=['password_hash'])
+
+@db.event.listens_for(User.email, 'set')
+def update_avatar_digest(target, value, oldvalue, initiator):
+	target.avatar_digest = User.email_digest(value) if value else None
+
 listing_tag_assoc = db.Table('listing_tag_assoc',
-	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id')),
-	db.Column('tag_id', db.Integer, db.ForeignKey('listing_tag.id'))
+	db.Column('listing_id', db.Integer, db.ForeignKey('listing.id'), primary_key=True),
+	db.Column('tag_id', db.Integer, db.ForeignKey('listing_tag.id'), primary_key=True),
+	db.Index('ix_listing_tag_assoc_tag_id_listing_id', 'tag_id', 'listing_id')
 )
 
-class Listing(db.Model):
+class Listing(SearchableMixin, db.Model):
+	__searchable__ = ['title', 'body']
 	id = db.Column(db.Integer, primary_key=True)
 	title = db.Column(db.String(64))
 	body = db.Column(db.String(1024))
@@ -73,9 +179,133 @@ class Listing(db.Model):
 	timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 	user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 	is_complete = db.Column(db.Boolean, default=False)
-	tags = db.relationship("ListingTag", secondary=listing_tag_assoc, backref="tagged_listing")
-	members = db.relationship("User", secondary=listing_user_assoc, backref="joined_listing")
-	interested_users = db.relationship("User", secondary=listing_interested_user_assoc, backref="interesting_listing")
+	card_version = db.Column(db.Integer, default=0, server_default='0')
+	#delete() removes the association rows itself, so the ORM never loads these to delete them
+	tags = db.relationship("ListingTag", secondary=listing_tag_assoc, backref="tagged_listing", passive_deletes=True)
+	members = db.relationship("User", secondary=listing_user_assoc, backref="joined_listing", passive_deletes=True)
+	interested_users = db.relationship("User", secondary=listing_interested_user_assoc, backref="interesting_listing",
+		passive_deletes=True)
+	__table_args__ = (db.Index('ix_listing_is_complete_timestamp', 'is_complete', 'timestamp'),)
+
+	def set_tags(self, names):
+		old = set(tag.tag for tag in self.tags) if self.id is not None else set()
+		self.tags = ListingTag.resolve(names)
+		new = set(tag.tag for tag in self.tags)
+		changes = [(name, 1) for name in new - old] + [(name, -1) for name in old - new]
+		db.session.info.setdefault('tag_changes', []).extend(changes)
+
+	@classmethod
+	def card_query(cls):
+		#Loads everything _listing.html touches so a page of cards renders in a fixed number of queries
+		return cls.query.options(db.joinedload(cls.owner), db.selectinload(cls.tags))
+
+	@staticmethod
+	def tagged_with(tags):
+		#Relational division: keep the listings that carry every one of the requested tags
+		tags = set(tags)
+		matches = db.session.query(listing_tag_assoc.c.listing_id).join(
+			ListingTag, ListingTag.id == listing_tag_assoc.c.tag_id).filter(
+			ListingTag.tag.in_(tags)).group_by(listing_tag_assoc.c.listing_id).having(
+			db.func.count(db.distinct(ListingTag.id)) == len(tags))
+		return Listing.id.in_(matches)
+
+	#Membership checks, counts and changes go straight to the association tables' primary keys,
+	#so a project with hundreds of join requests never loads them to test or move one user
+	def is_member(self, user):
+		return self._contains(listing_user_assoc, user)
+
+	def is_interested(self, user):
+		return self._contains(listing_interested_user_assoc, user)
+
+	def member_count(self):
+		return self._count(listing_user_assoc)
+
+	def interested_count(self):
+		return self._count(listing_interested_user_assoc)
+
+	def member_query(self):
+		return self._users(listing_user_assoc)
+
+	def interested_query(self):
+		return self._users(listing_interested_user_assoc)
+
+	def add_member(self, user):
+		self._link(listing_user_assoc, user)
+
+	def remove_member(self, user):
+		return self._unlink(listing_user_assoc, user)
+
+	def add_interested(self, user):
+		self._link(listing_interested_user_assoc, user)
+
+	def remove_interested(self, user):
+		return self._unlink(listing_interested_user_assoc, user)
+
+	def message_members(self, sender, body):
+		#Sends body to every other member with a fixed number of statements whatever the team size:
+		#one INSERT ... SELECT of the messages, one UPDATE of the unread counters and one notification upsert.
+		#Returns how many messages were sent, the caller commits.
+		others = db.and_(listing_user_assoc.c.listing_id == self.id, listing_user_assoc.c.user_id != sender.id)
+		recipients = db.select([listing_user_assoc.c.user_id]).where(others)
+		sent = db.session.execute(Message.__table__.insert().from_select(
+			['sender_id', 'recipient_id', 'body', 'timestamp'],
+			db.select([db.literal(sender.id), listing_user_assoc.c.user_id, db.literal(body),
+				db.literal(datetime.utcnow(), db.DateTime)]).where(others))).rowcount
+		if not sent:
+			return 0
+		users = User.__table__
+		db.session.execute(users.update().where(users.c.id.in_(recipients)).values(
+			unread_count=users.c.unread_count + 1))
+		counts = db.select([users.c.id.label('user_id'), db.cast(users.c.unread_count, db.String).label(
+			'payload_json')]).where(users.c.id.in_(recipients)).alias()
+		timestamp = time()
+		Notification.upsert_from_select(db.session, db.session.get_bind().dialect,
+			'unread_message_count', counts, timestamp)
+		#Streams get the new counts once the transaction commits, like add_notification
+		events = db.session.info.setdefault('notifications', [])
+		for user_id, count in db.session.execute(db.select([counts.c.user_id, counts.c.payload_json])):
+			events.append((user_id, {'name': 'unread_message_count', 'data': int(count), 'timestamp': timestamp}))
+		return sent
+
+	def delete(self):
+		#Deletes the listing and its association rows with a fixed number of statements, however many
+		#members and join requests it has. The caller commits.
+		users = User.__table__
+		linked = db.union(*[db.select([table.c.user_id]).where(table.c.listing_id == self.id)
+			for table in (listing_user_assoc, listing_interested_user_assoc)])
+		db.session.execute(users.update().where(users.c.id.in_(linked)).values(recommendations_stale=True))
+		names = [name for name, in db.session.query(ListingTag.tag).join(
+			listing_tag_assoc, listing_tag_assoc.c.tag_id == ListingTag.id).filter(listing_tag_assoc.c.listing_id == self.id)]
+		db.session.info.setdefault('tag_changes', []).extend((name, -1) for name in names)
+		for table in (listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc):
+			db.session.execute(table.delete().where(table.c.listing_id == self.id))
+		#Collections loaded earlier in the request would otherwise have their rows deleted a second time
+		db.session.expire(self, ['tags', 'members', 'interested_users'])
+		db.session.delete(self)
+
+	def _contains(self, table, user):
+		return db.session.query(db.exists().where(db.and_(
+			table.c.listing_id == self.id, table.c.user_id == user.id))).scalar()
+
+	def _count(self, table):
+		return db.session.query(db.func.count()).select_from(table).filter(table.c.listing_id == self.id).scalar()
+
+	def _users(self, table):
+		return User.query.join(table, table.c.user_id == User.id).filter(table.c.listing_id == self.id)
+
+	def _link(self, table, user):
+		db.session.execute(table.insert().values(listing_id=self.id, user_id=user.id))
+		#Core statements skip the collection history mark_recommendations_stale looks at
+		user.recommendations_stale = True
+
+	def _unlink(self, table, user):
+		#Returns whether the user was there, so check-and-remove is a single statement
+		removed = db.session.execute(table.delete().where(db.and_(
+			table.c.listing_id == self.id, table.c.user_id == user.id))).rowcount > 0
+		if removed:
+			user.recommendations_stale = True
+		return removed
+
 	def __repr__(self):
 		return '<Listing {}>'.format(self.title)
 
@@ -83,29 +313,227 @@ class ListingTag(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	tag = db.Column(db.String(32), unique=True)
 
+	@staticmethod
+	def parse(text):
+		#'#Programming #Python' -> ['programming', 'python'], keeping the first occurrence of each tag
+		tags = (text or '').replace(" ","").lower().split('#')
+		return list(OrderedDict.fromkeys(filter(None, tags)))
+
+	@staticmethod
+	def resolve(names, session=None):
+		#Bulk get-or-create: one IN query for the existing tags, one batched insert for the missing ones.
+		#Inserts that lose a race with another creator are ignored and the winner's row is re-read.
+		session = session or db.session
+		names = list(OrderedDict.fromkeys(names))
+		if not names:
+			return []
+		found = {tag.tag: tag for tag in session.query(ListingTag).filter(ListingTag.tag.in_(names))}
+		missing = [name for name in names if name not in found]
+		if missing:
+			ListingTag.insert_missing(session, missing)
+			found.update((tag.tag, tag) for tag in session.query(ListingTag).filter(ListingTag.tag.in_(missing)))
+		return [found[name] for name in names]
+
+	@staticmethod
+	def insert_missing(session, names):
+		table = ListingTag.__table__
+		rows = [{'tag': name} for name in names]
+		dialect = session.get_bind().dialect.name
+		if dialect == 'sqlite':
+			session.execute(table.insert().prefix_with('OR IGNORE'), rows)
+		elif dialect == 'mysql':
+			session.execute(table.insert().prefix_with('IGNORE'), rows)
+		elif dialect == 'postgresql':
+			session.execute(postgresql.insert(table).on_conflict_do_nothing(index_elements=['tag']), rows)
+		else:
+			for row in rows:
+				try:
+					with session.begin_nested():
+						session.execute(table.insert(), row)
+				except IntegrityError:
+					pass
+
 	def __repr__(self):
 		return '<ListingTag {}>'.format(self.tag)
 
+@tag_index.loader
+def tag_usage():
+	return db.session.query(ListingTag.tag, db.func.count(listing_tag_assoc.c.listing_id)).outerjoin(
+		listing_tag_assoc, listing_tag_assoc.c.tag_id == ListingTag.id).group_by(ListingTag.id).all()
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     body = db.Column(db.String(140))
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_message_recipient_id_timestamp', 'recipient_id', 'timestamp'),)
 
     def __repr__(self):
         return '<Message {}>'.format(self.body)
 
+def count_new_messages(session, flush_context, instances):
+	#Increment in SQL (unread_count = unread_count + n) so concurrent senders can't lose updates
+	received = {}
+	for obj in session.new:
+		if isinstance(obj, Message):
+			recipient = obj.recipient or session.query(User).get(obj.recipient_id)
+			received[recipient] = received.get(recipient, 0) + 1
+	for recipient, count in received.items():
+		recipient.unread_count = User.unread_count + count
+
+db.event.listen(db.session, 'before_flush', count_new_messages)
+
+def bump_card_versions(session, flush_context, instances):
+	#Anything shown on a rendered listing card invalidates the cached card by bumping its version
+	def changed(obj, fields):
+		state = db.inspect(obj)
+		return any(state.attrs[field].history.has_changes() for field in fields)
+	for obj in session.dirty:
+		if isinstance(obj, Listing) and changed(obj, ['title', 'is_complete', 'tags', 'owner']):
+			obj.card_version = (obj.card_version or 0) + 1
+		elif isinstance(obj, User) and obj.id is not None and changed(obj, ['username', 'email']):
+			session.execute(Listing.__table__.update().where(Listing.user_id == obj.id).values(
+				card_version=Listing.card_version + 1))
+
+db.event.listen(db.session, 'before_flush', bump_card_versions)
+
+def evict_deleted_cards(session, flush_context):
+	for obj in session.deleted:
+		if isinstance(obj, Listing):
+			fragment_cache.evict(fragment_cache.listing_key(obj))
+
+db.event.listen(db.session, 'after_flush', evict_deleted_cards)
+
+def mark_recommendations_stale(session, flush_context, instances):
+	#Users whose memberships change get their recommendations rebuilt by the next incremental run
+	for obj in list(session.new) + list(session.dirty):
+		if isinstance(obj, Listing):
+			state = db.inspect(obj)
+			for field in ('members', 'interested_users'):
+				history = state.attrs[field].history
+				for user in list(history.added or ()) + list(history.deleted or ()):
+					user.recommendations_stale = True
+
+db.event.listen(db.session, 'before_flush', mark_recommendations_stale)
+
+class Recommendation(db.Model):
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+	listing_id = db.Column(db.Integer, db.ForeignKey('listing.id', ondelete='CASCADE'), primary_key=True)
+	rank = db.Column(db.Integer)
+	score = db.Column(db.Float)
+	__table_args__ = (db.Index('ix_recommendation_user_id_rank', 'user_id', 'rank'),)
+
+	def __repr__(self):
+		return '<Recommendation {} {}>'.format(self.user_id, self.listing_id)
+
+def delete_recommendations(session, flush_context, instances):
+	#SQLite does not enforce the ON DELETE CASCADE, so a deleted listing's recommendations go with it
+	deleted = [obj.id for obj in session.deleted if isinstance(obj, Listing)]
+	if deleted:
+		table = Recommendation.__table__
+		session.execute(table.delete().where(table.c.listing_id.in_(deleted)))
+
+db.event.listen(db.session, 'before_flush', delete_recommendations)
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     timestamp = db.Column(db.Float, index=True, default=time)
     payload_json = db.Column(db.Text)
+    __table_args__ = (
+        db.Index('ix_notification_user_id_name', 'user_id', 'name', unique=True),
+        db.Index('ix_notification_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
+    @staticmethod
+    def upsert(executor, dialect, user_id, name, payload_json, timestamp):
+        #A user keeps one notification per name, so replace it in place with a single statement
+        table = Notification.__table__
+        values = {'user_id': user_id, 'name': name, 'payload_json': payload_json, 'timestamp': timestamp}
+        if dialect.name == 'postgresql':
+            statement = postgresql.insert(table).values(**values)
+            statement = statement.on_conflict_do_update(index_elements=['user_id', 'name'], set_={
+                'payload_json': statement.excluded.payload_json, 'timestamp': statement.excluded.timestamp})
+        elif dialect.name == 'mysql':
+            statement = mysql.insert(table).values(**values)
+            statement = statement.on_duplicate_key_update(
+                payload_json=statement.inserted.payload_json, timestamp=statement.inserted.timestamp)
+        elif dialect.name == 'sqlite' and dialect.dbapi.sqlite_version_info >= (3, 24, 0):
+            statement = db.text('INSERT INTO notification (user_id, name, payload_json, timestamp) '
+                                'VALUES (:user_id, :name, :payload_json, :timestamp) '
+                                'ON CONFLICT (user_id, name) DO UPDATE SET '
+                                'payload_json = excluded.payload_json, timestamp = excluded.timestamp')
+            return executor.execute(statement, values)
+        else:
+            executor.execute(table.delete().where(db.and_(table.c.user_id == user_id, table.c.name == name)))
+            statement = table.insert().values(**values)
+        return executor.execute(statement)
+
+    @staticmethod
+    def upsert_from_select(executor, dialect, name, select, timestamp):
+        #Set-based upsert: select yields (user_id, payload_json) rows, each becoming that user's name notification
+        table = Notification.__table__
+        rows = db.select([select.c.user_id, select.c.payload_json, db.literal(name), db.literal(timestamp)])
+        columns = ['user_id', 'payload_json', 'name', 'timestamp']
+        if dialect.name == 'postgresql':
+            statement = postgresql.insert(table).from_select(columns, rows)
+            statement = statement.on_conflict_do_update(index_elements=['user_id', 'name'], set_={
+                'payload_json': statement.excluded.payload_json, 'timestamp': statement.excluded.timestamp})
+        elif dialect.name == 'mysql':
+            statement = mysql.insert(table).from_select(columns, rows)
+            statement = statement.on_duplicate_key_update(
+                payload_json=statement.inserted.payload_json, timestamp=statement.inserted.timestamp)
+        else:
+            #SQLite serializes writers, so replacing inside the transaction can't race another insert
+            executor.execute(table.delete().where(db.and_(
+                table.c.user_id.in_(db.select([select.c.user_id])), table.c.name == name)))
+            statement = table.insert().from_select(columns, rows)
+        return executor.execute(statement)
 
     def get_data(self):
         return json.loads(str(self.payload_json))
 
+    def to_dict(self):
+        return {'name': self.name, 'data': self.get_data(), 'timestamp': self.timestamp}
+
+class Job(db.Model):
+    #Outbox row for app.jobs.JobQueue
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64))
+    payload_json = db.Column(db.Text)
+    status = db.Column(db.String(16))
+    attempts = db.Column(db.Integer, default=0)
+    run_after = db.Column(db.Float)
+    claimed_by = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.Float)
+    last_error = db.Column(db.Text)
+    created = db.Column(db.Float)
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
+
+    def __repr__(self):
+        return '<Job {} {}>'.format(self.id, self.name)
+
+@jobs.handler('send_message')
+def deliver_message(sender_id, recipient_id, body):
+	recipient = User.query.get(recipient_id)
+	db.session.add(Message(sender_id=sender_id, recipient=recipient, body=body))
+	recipient.add_notification('unread_message_count', recipient.new_messages())
+
+def publish_notifications(session):
+	#Only push notifications to open streams, and tag usage to the suggestion index, once committed
+	for user_id, event in session.info.pop('notifications', []):
+		notification_hub.publish(user_id, event)
+	tag_index.update(session.info.pop('tag_changes', []))
+
+def discard_notifications(session, previous_transaction):
+	session.info.pop('notifications', None)
+	session.info.pop('tag_changes', None)
+
+db.event.listen(db.session, 'after_commit', publish_notifications)
+db.event.listen(db.session, 'after_soft_rollback', discard_notifications)
+
 @login.user_loader
 def load_user(id):
-	return User.query.get(int(id))
+	return user_cache.get(int(id))
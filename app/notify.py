@@ -0,0 +1,61 @@
+import json
+import queue
+import threading
+from time import monotonic
+
+class NotificationHub(object):
+	#In-process publish/subscribe for notifications. Each open stream gets its own bounded queue;
+	#streams on other worker processes catch up from the database on every keepalive instead.
+	#A stream occupies its worker until it times out, hence NOTIFICATION_STREAM is off by default.
+	def __init__(self, queue_size=64):
+		self.queue_size = queue_size
+		self.lock = threading.Lock()
+		self.subscribers = {}
+
+	def subscribe(self, user_id):
+		q = queue.Queue(maxsize=self.queue_size)
+		with self.lock:
+			self.subscribers.setdefault(user_id, set()).add(q)
+		return q
+
+	def unsubscribe(self, user_id, q):
+		with self.lock:
+			queues = self.subscribers.get(user_id)
+			if queues is not None:
+				queues.discard(q)
+				if not queues:
+					del self.subscribers[user_id]
+
+	def publish(self, user_id, event):
+		with self.lock:
+			queues = list(self.subscribers.get(user_id, ()))
+		for q in queues:
+			try:
+				q.put_nowait(event)
+			except queue.Full:
+				#A stalled client picks the notification up from the database on its next keepalive
+				pass
+
+	def stream(self, user_id, since, backlog, timeout, keepalive):
+		#Yields server-sent events for user_id newer than since. backlog(user_id, since) returns the
+		#stored notifications, used to resume and to catch up with other processes.
+		q = self.subscribe(user_id)
+		try:
+			yield 'retry: 5000\n\n'
+			deadline = monotonic() + timeout
+			events = backlog(user_id, since)
+			while True:
+				for event in events:
+					if event['timestamp'] > since:
+						since = event['timestamp']
+						yield 'id: {}\ndata: {}\n\n'.format(since, json.dumps(event))
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					return
+				try:
+					events = [q.get(timeout=min(keepalive, remaining))]
+				except queue.Empty:
+					yield ': keepalive\n\n'
+					events = backlog(user_id, since)
+		finally:
+			self.unsubscribe(user_id, q)
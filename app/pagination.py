@@ -0,0 +1,85 @@
+import base64
+import json
+from datetime import datetime
+from flask_sqlalchemy import Pagination
+from app import db
+
+#Keyset pagination over (timestamp, id), newest first. Pages are addressed by opaque after/before
+#cursors instead of an OFFSET, so every page costs one indexed range query and no COUNT.
+#The older ?page= urls are still served through the regular Flask-SQLAlchemy paginate.
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def encode_cursor(item):
+	data = json.dumps([item.timestamp.strftime(TIMESTAMP_FORMAT), item.id])
+	return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+	try:
+		data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+		timestamp, id = json.loads(data.decode('utf-8'))
+		return datetime.strptime(timestamp, TIMESTAMP_FORMAT), int(id)
+	except (ValueError, TypeError):
+		return None
+
+class KeysetPage(object):
+	def __init__(self, items, has_next, has_prev, args):
+		self.items = items
+		self.has_next = has_next
+		self.has_prev = has_prev
+		self.args = args
+
+	@property
+	def next_cursor(self):
+		return encode_cursor(self.items[-1]) if self.items else None
+
+	@property
+	def prev_cursor(self):
+		return encode_cursor(self.items[0]) if self.items else None
+
+def keyset_paginate(query, model, per_page, after=None, before=None):
+	query = query.order_by(None)
+	per_page = int(per_page)
+	cursor = decode_cursor(before) if before else None
+	if cursor is not None:
+		timestamp, id = cursor
+		items = query.filter(db.or_(model.timestamp > timestamp, db.and_(
+			model.timestamp == timestamp, model.id > id))).order_by(
+			model.timestamp.asc(), model.id.asc()).limit(per_page + 1).all()
+		has_prev = len(items) > per_page
+		return KeysetPage(items[:per_page][::-1], True, has_prev, {'before': before})
+	cursor = decode_cursor(after) if after else None
+	if cursor is not None:
+		timestamp, id = cursor
+		query = query.filter(db.or_(model.timestamp < timestamp, db.and_(
+			model.timestamp == timestamp, model.id < id)))
+	items = query.order_by(model.timestamp.desc(), model.id.desc()).limit(per_page + 1).all()
+	args = {'after': after} if cursor is not None else {}
+	return KeysetPage(items[:per_page], len(items) > per_page, cursor is not None, args)
+
+def paginate(query, model, per_page, args, prefix='', total=None):
+	#Serves legacy ?page= links with an OFFSET query, everything else with keyset cursors.
+	#Callers that already know the number of rows pass total to skip the COUNT.
+	if prefix + 'page' in args:
+		page = args.get(prefix + 'page', 1, type=int)
+		if total is None:
+			return query.paginate(page, per_page, False)
+		page = max(page, 1)
+		items = query.limit(per_page).offset((page - 1) * per_page).all()
+		return Pagination(query, page, per_page, total, items)
+	return keyset_paginate(query, model, per_page, args.get(prefix + 'after'), args.get(prefix + 'before'))
+
+def current_page_args(pagination, prefix=''):
+	if isinstance(pagination, KeysetPage):
+		return {prefix + key: value for key, value in pagination.args.items()}
+	return {prefix + 'page': pagination.page}
+
+def next_page_args(pagination, prefix=''):
+	if isinstance(pagination, KeysetPage):
+		return {prefix + 'after': pagination.next_cursor}
+	return {prefix + 'page': pagination.next_num}
+
+def prev_page_args(pagination, prefix=''):
+	if isinstance(pagination, KeysetPage):
+		return {prefix + 'before': pagination.prev_cursor}
+	return {prefix + 'page': pagination.prev_num}
@@ -0,0 +1,76 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+class HashingUnavailable(Exception):
+	pass
+
+class PasswordHasher(object):
+	#Runs password hashing in a process pool so a burst of logins can't pin the request workers.
+	#The pool is created on first use; PASSWORD_HASH_WORKERS = 0 hashes inline instead.
+	def __init__(self, app=None):
+		self.executor = None
+		self.lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.configure(app.config)
+
+	def configure(self, config):
+		method = config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+		if method.startswith('pbkdf2:') and method.count(':') == 1:
+			method = '{}:{}'.format(method, DEFAULT_PBKDF2_ITERATIONS)
+		self.method = method
+		self.salt_length = config.get('PASSWORD_SALT_LENGTH', 8)
+		self.workers = config.get('PASSWORD_HASH_WORKERS', 0)
+		self.timeout = config.get('PASSWORD_HASH_TIMEOUT', 10)
+		self.slots = threading.BoundedSemaphore(self.workers + config.get('PASSWORD_HASH_QUEUE', 32))
+
+	def run(self, function, *args):
+		if not self.workers:
+			return function(*args)
+		#Bound how many hashes can wait for the pool, refusing new work rather than piling it up
+		if not self.slots.acquire(timeout=self.timeout):
+			raise HashingUnavailable()
+		try:
+			with self.lock:
+				if self.executor is None:
+					self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context())
+			future = self.executor.submit(function, *args)
+		except Exception:
+			self.slots.release()
+			raise
+		#The slot is given back when the hash really finishes, not when we stop waiting for it,
+		#so hashes that outlive the timeout still count against the queue bound
+		future.add_done_callback(lambda future: self.slots.release())
+		try:
+			return future.result(timeout=self.timeout)
+		except TimeoutError:
+			future.cancel()
+			raise HashingUnavailable()
+
+	@staticmethod
+	def context():
+		#Forking a process that already runs job, flush and stream threads can copy a held lock
+		#into the child, so the pool starts its workers from a clean process instead
+		methods = multiprocessing.get_all_start_methods()
+		return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+	def generate(self, password):
+		return self.run(generate_password_hash, password, self.method, self.salt_length)
+
+	def check(self, password_hash, password):
+		return self.run(check_password_hash, password_hash, password)
+
+	def needs_rehash(self, password_hash):
+		method, _, rest = (password_hash or '').partition('$')
+		salt = rest.partition('$')[0]
+		return method != self.method or len(salt) != self.salt_length
+
+	def shutdown(self):
+		with self.lock:
+			if self.executor is not None:
+				self.executor.shutdown()
+				self.executor = None
@@ -0,0 +1,118 @@
+import numpy as np
+from app import db
+from app.models import User, Listing, Recommendation
+from app.models import listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc
+
+#Content based recommendations. Every user gets a tag profile from the listings they joined
+#(and, at half weight, the ones they asked to join); open listings are scored by cosine
+#similarity between that profile and their own tags, a batch of users at a time.
+#Listings are kept sparse, as the tag columns of each listing (CSR style), and scored a chunk of
+#listings at a time with a gather and a segmented sum, so memory is bounded by the batch and chunk
+#sizes rather than by listings x tags.
+
+INTERESTED_WEIGHT = 0.5
+LISTING_CHUNK = 2048
+
+class ListingTags(object):
+	#Listing i carries tag columns indices[indptr[i]:indptr[i + 1]]
+	def __init__(self, ids, tag_columns, indptr, indices):
+		self.ids = ids
+		self.tag_columns = tag_columns
+		self.indptr = indptr
+		self.indices = indices
+		self.norms = np.sqrt(np.diff(indptr)).astype(np.float32)
+
+	def __len__(self):
+		return len(self.ids)
+
+def listing_tags():
+	rows = db.session.query(listing_tag_assoc.c.listing_id, listing_tag_assoc.c.tag_id).join(
+		Listing, Listing.id == listing_tag_assoc.c.listing_id).filter(Listing.is_complete == False).order_by(
+		listing_tag_assoc.c.listing_id).all()
+	if not rows:
+		return ListingTags(np.zeros(0, dtype=np.int64), {}, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64))
+	pairs = np.array(rows, dtype=np.int64)
+	listing_ids, counts = np.unique(pairs[:, 0], return_counts=True)
+	tag_ids, indices = np.unique(pairs[:, 1], return_inverse=True)
+	indptr = np.concatenate([[0], np.cumsum(counts)])
+	return ListingTags(listing_ids, {tag_id: column for column, tag_id in enumerate(tag_ids)}, indptr, indices)
+
+def user_tag_weights(user_ids):
+	#Sparse (user, tag, weight) triples, aggregated in SQL through the association tables
+	triples = []
+	for table, weight in ((listing_user_assoc, 1.0), (listing_interested_user_assoc, INTERESTED_WEIGHT)):
+		triples.extend((user_id, tag_id, count * weight) for user_id, tag_id, count in db.session.query(
+			table.c.user_id, listing_tag_assoc.c.tag_id, db.func.count()).join(
+			listing_tag_assoc, listing_tag_assoc.c.listing_id == table.c.listing_id).filter(
+			table.c.user_id.in_(user_ids)).group_by(table.c.user_id, listing_tag_assoc.c.tag_id))
+	return triples
+
+def excluded_listings(user_ids):
+	#Listings a user already belongs to, asked to join or owns are never recommended back
+	pairs = []
+	for table in (listing_user_assoc, listing_interested_user_assoc):
+		pairs.extend(db.session.query(table.c.user_id, table.c.listing_id).filter(table.c.user_id.in_(user_ids)))
+	pairs.extend(db.session.query(Listing.user_id, Listing.id).filter(Listing.user_id.in_(user_ids)))
+	return pairs
+
+def score_batch(user_ids, listings, k, chunk_size=LISTING_CHUNK):
+	row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+	profiles = np.zeros((len(user_ids), len(listings.tag_columns)), dtype=np.float32)
+	for user_id, tag_id, weight in user_tag_weights(user_ids):
+		column = listings.tag_columns.get(tag_id)
+		if column is not None:
+			profiles[row_of[user_id], column] += weight
+	norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+	profiles /= np.where(norms > 0, norms, 1.0)
+	listing_row = {listing_id: row for row, listing_id in enumerate(listings.ids)}
+	excluded = [(row_of[user_id], listing_row[listing_id])
+		for user_id, listing_id in excluded_listings(user_ids) if listing_id in listing_row]
+	excluded_users = np.array([user for user, _ in excluded], dtype=np.int64)
+	excluded_rows = np.array([row for _, row in excluded], dtype=np.int64)
+	best_scores = np.zeros((len(user_ids), 0), dtype=np.float32)
+	best_rows = np.zeros((len(user_ids), 0), dtype=np.int64)
+	for start in range(0, len(listings), chunk_size):
+		end = min(start + chunk_size, len(listings))
+		low, high = listings.indptr[start], listings.indptr[end]
+		#Sum each listing's tag columns of the profiles, then divide by the listing's norm
+		gathered = profiles[:, listings.indices[low:high]]
+		scores = np.add.reduceat(gathered, listings.indptr[start:end] - low, axis=1) / listings.norms[start:end]
+		chunk = (excluded_rows >= start) & (excluded_rows < end)
+		scores[excluded_users[chunk], excluded_rows[chunk] - start] = -1.0
+		#Keep a running top k per user over the chunks seen so far
+		best_scores = np.concatenate([best_scores, scores], axis=1)
+		best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1)
+		if best_scores.shape[1] > k:
+			top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+			best_scores = np.take_along_axis(best_scores, top, axis=1)
+			best_rows = np.take_along_axis(best_rows, top, axis=1)
+	order = np.argsort(-best_scores, axis=1, kind='stable')
+	best_scores = np.take_along_axis(best_scores, order, axis=1)
+	best_rows = np.take_along_axis(best_rows, order, axis=1)
+	rows = []
+	for row, user_id in enumerate(user_ids):
+		rank = 0
+		for listing, score in zip(best_rows[row], best_scores[row]):
+			if score <= 0:
+				break
+			rank += 1
+			rows.append({'user_id': user_id, 'listing_id': int(listings.ids[listing]), 'rank': rank, 'score': float(score)})
+	return rows
+
+def rebuild(everyone=False, k=20, batch_size=512):
+	#Recomputes recommendations for users flagged stale (or everyone) and returns how many were rebuilt
+	query = db.session.query(User.id)
+	if not everyone:
+		query = query.filter(User.recommendations_stale == True)
+	user_ids = [user_id for user_id, in query.order_by(User.id)]
+	listings = listing_tags()
+	table = Recommendation.__table__
+	for start in range(0, len(user_ids), batch_size):
+		batch = user_ids[start:start + batch_size]
+		rows = score_batch(batch, listings, k) if len(listings) else []
+		db.session.execute(table.delete().where(table.c.user_id.in_(batch)))
+		if rows:
+			db.session.execute(table.insert(), rows)
+		db.session.execute(User.__table__.update().where(User.id.in_(batch)).values(recommendations_stale=False))
+		db.session.commit()
+	return len(user_ids)
@@ -1,7 +1,8 @@
-from flask import render_template, flash, redirect, url_for, request, jsonify
+from flask import render_template, flash, redirect, url_for, request, jsonify, abort, Response, stream_with_context
 from flask_login import current_user, login_user, logout_user, login_required
 from werkzeug.urls import url_parse
-from app import app
+from app import app, jobs, last_seen, notification_hub, request_metrics, tag_index
+from app.passwords import HashingUnavailable
 from app.models import User, db
 from app.forms import LoginForm, RegistrationForm, EditProfileForm, CreateListingForm, EditListingForm, SearchForm
 from datetime import datetime
@@ -9,14 +10,15 @@ from app.models import Listing, ListingTag
 from app.forms import MessageForm
 from app.models import Message
 from app.models import Notification
-from collections import OrderedDict
+from app.models import Recommendation
 from sqlalchemy.sql import exists
+from app.pagination import paginate, current_page_args, next_page_args, prev_page_args
+from app.export import EXPORTS, ndjson, parse_time
 
 @app.before_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        last_seen.record(current_user)
 
 @app.route('/', methods=['GET', 'POST'])
 @app.route('/index', methods=['GET', 'POST'])
@@ -46,26 +48,29 @@ def index():
                 flash('No user found with the entered username')
         if form.clear.data:
             return redirect(url_for('index'))
-    results = Listing.query.filter_by(is_complete=False).order_by(Listing.timestamp.desc())
-    listings = results.paginate(page, app.config['LISTINGS_PER_PAGE'], False)
+    results = Listing.card_query().filter_by(is_complete=False).order_by(Listing.timestamp.desc())
     if tags is not None:
-        search_tags = set(list(filter(None, tags.split('#'))))
-        desired_listings = set()
-        for result in results:
-            found_tags = set()
-            for tag in result.tags:
-                found_tags.add(tag.tag)
-            if search_tags.issubset(found_tags):
-                desired_listings.add(result.id)
-        listings = Listing.query.filter(Listing.id.in_(desired_listings)).order_by(Listing.timestamp.desc()).paginate(page, app.config['LISTINGS_PER_PAGE'], False) 
+        search_tags = set(filter(None, tags.split('#')))
+        if search_tags:
+            results = results.filter(Listing.tagged_with(search_tags))
     if title is not None:
-        listings = Listing.query.filter(Listing.title.contains(title)).order_by(Listing.timestamp.desc()).paginate(page, app.config['LISTINGS_PER_PAGE'], False)
-    next_url = url_for('index', page=listings.next_num, tags=tags, title=title) \
+        listings = Listing.search(title, page, app.config['LISTINGS_PER_PAGE'], Listing.card_query())
+    else:
+        listings = paginate(results, Listing, app.config['LISTINGS_PER_PAGE'], request.args)
+    next_url = url_for('index', tags=tags, title=title, **next_page_args(listings)) \
         if listings.has_next else None
-    prev_url = url_for('index', page=listings.prev_num, tags=tags, title=title) \
+    prev_url = url_for('index', tags=tags, title=title, **prev_page_args(listings)) \
         if listings.has_prev else None
     return render_template('index.html', title='Home', listings=listings.items, next_url=next_url, prev_url=prev_url, form=form)
 
+@app.route('/recommended')
+@login_required
+def recommended():
+    listings = Listing.card_query().join(Recommendation, Recommendation.listing_id == Listing.id).filter(
+        Recommendation.user_id == current_user.id, Listing.is_complete == False).order_by(
+        Recommendation.rank).limit(app.config['RECOMMENDATIONS_PER_USER']).all()
+    return render_template('recommended.html', title='Recommended', listings=listings)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -73,9 +78,15 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingUnavailable:
+            flash('The server is busy, please try again in a moment')
+            return redirect(url_for('login'))
+        if not valid:
             flash('Invalid email or password')
             return redirect(url_for('login'))
+        db.session.commit()
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get('next')
         if not next_page or url_parse(next_page).netloc != '':
@@ -95,7 +106,11 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(username=form.username.data, email=form.email.data, major=form.major.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingUnavailable:
+            flash('The server is busy, please try again in a moment')
+            return render_template('register.html', title='Register', form=form)
         db.session.add(user)
         db.session.commit()
         flash('Welcome, you are now a registered user!')
@@ -106,23 +121,22 @@ def register():
 @login_required
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    lpage = request.args.get('lpage', 1, type=int)
-    rpage = request.args.get('rpage', 1, type=int)
-    desired_ids = set()
-    for listing in user.joined_listing:
-        desired_ids.add(listing.id)
-    user_listings = Listing.query.filter(Listing.id.in_(desired_ids))
-    curr_listings = user_listings.filter_by(is_complete=False).order_by(Listing.timestamp.desc()).paginate(lpage, app.config['LISTINGS_PER_PAGE']/2, False)
-    comp_listings = user_listings.filter_by(is_complete=True).order_by(Listing.timestamp.desc()).paginate(rpage, app.config['LISTINGS_PER_PAGE']/2, False)
-    curr_next_url = url_for('user', username=user.username, lpage=curr_listings.next_num, rpage=comp_listings.page) \
+    curr_count, comp_count = user.project_counts()
+    per_column = app.config['LISTINGS_PER_PAGE'] // 2
+    curr_listings = paginate(user.joined_listings().filter(Listing.is_complete == False).order_by(Listing.timestamp.desc()),
+                             Listing, per_column, request.args, 'l', curr_count)
+    comp_listings = paginate(user.joined_listings().filter(Listing.is_complete == True).order_by(Listing.timestamp.desc()),
+                             Listing, per_column, request.args, 'r', comp_count)
+    curr_next_url = url_for('user', username=user.username, **next_page_args(curr_listings, 'l'), **current_page_args(comp_listings, 'r')) \
         if curr_listings.has_next else None
-    curr_prev_url = url_for('user', username=user.username, lpage=curr_listings.prev_num, rpage=comp_listings.page) \
+    curr_prev_url = url_for('user', username=user.username, **prev_page_args(curr_listings, 'l'), **current_page_args(comp_listings, 'r')) \
         if curr_listings.has_prev else None
-    comp_next_url = url_for('user', username=user.username, lpage=curr_listings.page, rpage=comp_listings.next_num) \
+    comp_next_url = url_for('user', username=user.username, **current_page_args(curr_listings, 'l'), **next_page_args(comp_listings, 'r')) \
         if comp_listings.has_next else None
-    comp_prev_url = url_for('user', username=user.username, lpage=curr_listings.page, rpage=comp_listings.prev_num) \
+    comp_prev_url = url_for('user', username=user.username, **current_page_args(curr_listings, 'l'), **prev_page_args(comp_listings, 'r')) \
         if comp_listings.has_prev else None
-    return render_template('user.html', user=user, curr_listings=curr_listings.items, curr_next_url=curr_next_url, curr_prev_url=curr_prev_url, comp_listings=comp_listings.items, comp_next_url=comp_next_url, comp_prev_url=comp_prev_url)
+    return render_template('user.html', user=user, curr_listings=curr_listings.items, curr_next_url=curr_next_url, curr_prev_url=curr_prev_url, comp_listings=comp_listings.items, comp_next_url=comp_next_url, comp_prev_url=comp_prev_url,
+                           curr_count=curr_count, comp_count=comp_count)
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
@@ -146,14 +160,7 @@ def create_listing():
     form = CreateListingForm()
     if form.validate_on_submit():
         listing = Listing(title=form.title.data, body=form.body.data, desired_size=form.desired_size.data, owner=current_user)
-        tags = form.tags.data
-        tags = tags.replace(" ","").lower().split('#')
-        tags = list(OrderedDict.fromkeys(filter(None, tags)))
-        for _tag in tags:
-            tag = ListingTag.query.filter_by(tag=_tag).first()
-            if tag is None:
-                tag=ListingTag(tag=_tag)
-            listing.tags.append(tag)
+        listing.set_tags(ListingTag.parse(form.tags.data))
         listing.members.append(current_user)
         db.session.add(listing)
         db.session.commit()
@@ -161,14 +168,34 @@ def create_listing():
         return redirect(url_for('index'))
     return render_template('create_listing.html', title='Create a Listing', form=form)
 
+@app.route('/tags/suggest')
+@login_required
+def suggest_tags():
+    prefix = request.args.get('prefix', '').replace(' ', '').lstrip('#').lower()
+    return jsonify([{'tag': tag, 'count': count} for tag, count in tag_index.suggest(prefix)])
+
+def owner_selection(field, query, page_arg):
+    #The owner's select lists are filled one page of usernames at a time. A submitted name only has to
+    #be accepted as a choice here, the handlers check membership with an EXISTS before acting on it
+    if request.method == 'POST':
+        name = request.form.get(field.name)
+        field.choices = [(name, name)] if name else []
+        return None
+    page = query.order_by(User.username).paginate(
+        request.args.get(page_arg, 1, type=int), app.config['SELECTION_PER_PAGE'], False)
+    field.choices = [(user.username, user.username) for user in page.items]
+    return page
+
 @app.route('/view_listing/<listing_id>', methods=['GET', 'POST'])
 @login_required
 def view_listing(listing_id):
     form = EditListingForm()
     listing = Listing.query.filter_by(id=listing_id).first_or_404()
+    is_member = listing.is_member(current_user)
+    kick_page = interested_page = message_form = None
     if listing.is_complete == True:
         del form.complete_project
-    if current_user.id is not listing.owner.id:
+    if current_user.id != listing.user_id:
         del form.kick_submit
         del form.kick_selection
         del form.interested_accept
@@ -177,56 +204,50 @@ def view_listing(listing_id):
         del form.complete_project
         del form.delete_project
     else:
-        memberList = []
-        for member in listing.members:
-            if member.id is not listing.owner.id:
-                memberList.append((member.username, member.username))
-        form.kick_selection.choices = memberList
-        if len(memberList) == 0:
+        kick_page = owner_selection(form.kick_selection,
+            listing.member_query().filter(User.id != listing.user_id), 'kick_page')
+        if len(form.kick_selection.choices) == 0:
             del form.kick_submit
             del form.kick_selection
-        interestedList = []
-        for interested in listing.interested_users:
-            interestedList.append((interested.username, interested.username))
-        form.interested_selection.choices=interestedList
-        if len(interestedList) == 0:
+        interested_page = owner_selection(form.interested_selection, listing.interested_query(), 'interested_page')
+        if len(form.interested_selection.choices) == 0:
             del form.interested_accept
             del form.interested_reject
             del form.interested_selection
         del form.leave_project
-    if current_user in listing.members:
+        message_form = MessageForm(prefix='team')
+        if message_form.submit.data and message_form.validate_on_submit():
+            sent = listing.message_members(current_user, message_form.message.data)
+            db.session.commit()
+            flash('Your message has been sent to {} members.'.format(sent))
+            return redirect(url_for('view_listing', listing_id=listing.id))
+    if is_member:
         del form.join_project
     else:
         del form.leave_project 
     if form.validate_on_submit():
         if not listing.is_complete and form.kick_submit is not None and form.kick_submit.data:
             target_user=User.query.filter_by(username=form.kick_selection.data).first_or_404()
-            if target_user in listing.members:
-                listing.members.remove(target_user)
-                msg = Message(sender=current_user, recipient=target_user, body="You have been kicked from project: "+listing.title)
-                db.session.add(msg)
-                target_user.add_notification('unread_message_count', target_user.new_messages())
+            if target_user.id != listing.user_id and listing.remove_member(target_user):
+                jobs.enqueue('send_message', sender_id=current_user.id, recipient_id=target_user.id,
+                             body="You have been kicked from project: "+listing.title)
                 db.session.commit()
                 flash(target_user.username + " has been kicked")
             return redirect(url_for('view_listing', listing_id=listing.id))
         if not listing.is_complete and form.interested_accept is not None and form.interested_accept.data:
             target_user=User.query.filter_by(username=form.interested_selection.data).first_or_404()
-            if target_user in listing.interested_users:
-                listing.interested_users.remove(target_user)
-                listing.members.append(target_user)
-                msg = Message(sender=current_user, recipient=target_user, body="You have been accepted into project: "+listing.title)
-                db.session.add(msg)
-                target_user.add_notification('unread_message_count', target_user.new_messages())
+            if listing.remove_interested(target_user):
+                listing.add_member(target_user)
+                jobs.enqueue('send_message', sender_id=current_user.id, recipient_id=target_user.id,
+                             body="You have been accepted into project: "+listing.title)
                 db.session.commit()
                 flash(target_user.username + " has been accepted as a project member")
             return redirect(url_for('view_listing', listing_id=listing.id))
         if not listing.is_complete and form.interested_reject is not None and form.interested_reject.data:
             target_user=target_user=User.query.filter_by(username=form.interested_selection.data).first_or_404()
-            if target_user in listing.interested_users:
-                listing.interested_users.remove(target_user)
-                msg = Message(sender=current_user, recipient=target_user, body="You have been rejected from project: "+listing.title)
-                db.session.add(msg)
-                target_user.add_notification('unread_message_count', target_user.new_messages())
+            if listing.remove_interested(target_user):
+                jobs.enqueue('send_message', sender_id=current_user.id, recipient_id=target_user.id,
+                             body="You have been rejected from project: "+listing.title)
                 db.session.commit()
                 flash(target_user.username + " has been rejected as a project member")
             return redirect(url_for('view_listing', listing_id=listing.id))
@@ -234,28 +255,26 @@ def view_listing(listing_id):
             setattr(listing, 'is_complete', True)
             db.session.commit()
         if form.delete_project is not None and form.delete_project.data:
-            listing.tags.clear()    
-            listing.members.clear()
-            Listing.query.filter_by(id=listing_id).delete()
+            listing.delete()
             db.session.commit()
         if form.join_project is not None and form.join_project.data:
-            if current_user not in listing.members:
-                listing.interested_users.append(current_user)
-                msg = Message(sender=current_user, recipient=listing.owner, body=current_user.username+" would like to join: "+ listing.title +" please view the listing to accept")
-                db.session.add(msg)
-                listing.owner.add_notification('unread_message_count', listing.owner.new_messages())
+            if not is_member and not listing.is_interested(current_user):
+                listing.add_interested(current_user)
+                jobs.enqueue('send_message', sender_id=current_user.id, recipient_id=listing.user_id,
+                             body=current_user.username+" would like to join: "+ listing.title +" please view the listing to accept")
                 db.session.commit()
                 flash("A request to join " + listing.title + " has been sent.")
         if form.leave_project is not None and form.leave_project.data:
-            if current_user in listing.members:
-                listing.members.remove(current_user)
-                msg = Message(sender=current_user, recipient=listing.owner, body=current_user.username+" has left project: "+listing.title)
-                db.session.add(msg)
-                listing.owner.add_notification('unread_message_count', listing.owner.new_messages())
+            if listing.remove_member(current_user):
+                jobs.enqueue('send_message', sender_id=current_user.id, recipient_id=listing.user_id,
+                             body=current_user.username+" has left project: "+listing.title)
                 db.session.commit()
                 flash('You have been removed from the project.')
         return redirect(url_for('index'))
-    return render_template('view_listing.html', listing=listing, form=form)
+    members = listing.member_query().order_by(User.username).limit(app.config['SELECTION_PER_PAGE']).all()
+    return render_template('view_listing.html', listing=listing, form=form, is_member=is_member,
+                           members=members, member_count=listing.member_count(),
+                           kick_page=kick_page, interested_page=interested_page, message_form=message_form)
 
 @app.route('/send_message/<recipient>', methods=['GET', 'POST'])
 @login_required
@@ -277,15 +296,14 @@ def send_message(recipient):
 @login_required
 def messages():
     current_user.last_message_read_time = datetime.utcnow()
+    current_user.unread_count = 0
     current_user.add_notification('unread_message_count', 0)
     db.session.commit()
-    page = request.args.get('page', 1, type=int)
-    messages = current_user.messages_received.order_by(
-        Message.timestamp.desc()).paginate(
-            page, app.config['LISTINGS_PER_PAGE'], False)
-    next_url = url_for('messages', page=messages.next_num) \
+    messages = paginate(current_user.messages_received.order_by(
+        Message.timestamp.desc()), Message, app.config['LISTINGS_PER_PAGE'], request.args)
+    next_url = url_for('messages', **next_page_args(messages)) \
         if messages.has_next else None
-    prev_url = url_for('messages', page=messages.prev_num) \
+    prev_url = url_for('messages', **prev_page_args(messages)) \
         if messages.has_prev else None
     return render_template('messages.html', messages=messages.items,
                            next_url=next_url, prev_url=prev_url)
@@ -296,8 +314,48 @@ def notifications():
     since = request.args.get('since', 0.0, type=float)
     notifications = current_user.notifications.filter(
         Notification.timestamp > since).order_by(Notification.timestamp.asc())
-    return jsonify([{
-        'name': n.name,
-        'data': n.get_data(),
-        'timestamp': n.timestamp
-    } for n in notifications])
\ No newline at end of file
+    return jsonify([n.to_dict() for n in notifications])
+
+def notifications_since(user_id, since):
+    with app.app_context():
+        return [n.to_dict() for n in Notification.query.filter(
+            Notification.user_id == user_id, Notification.timestamp > since).order_by(
+            Notification.timestamp.asc())]
+
+@app.route('/notifications/stream')
+@login_required
+def notification_stream():
+    if not app.config['NOTIFICATION_STREAM']:
+        abort(404)
+    since = max(request.args.get('since', 0.0, type=float),
+                request.headers.get('Last-Event-ID', 0.0, type=float))
+    events = notification_hub.stream(current_user.id, since, notifications_since,
+                                     app.config['NOTIFICATION_STREAM_TIMEOUT'],
+                                     app.config['NOTIFICATION_STREAM_KEEPALIVE'])
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != 'Bearer ' + token:
+        abort(403)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/export/<kind>')
+def export(kind):
+    #Exports include private messages, so unlike /metrics they are off until a token is configured
+    token = app.config['EXPORT_TOKEN']
+    if not token or request.headers.get('Authorization') != 'Bearer ' + token:
+        abort(403)
+    if kind not in EXPORTS:
+        abort(404)
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    after = request.args.get('after', 0, type=int)
+    rows = ndjson(kind, since, until, after, app.config['EXPORT_BATCH_SIZE'])
+    return Response(stream_with_context(rows), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
@@ -0,0 +1,67 @@
+import re
+from app import db
+
+#Full text search is backed by an SQLite FTS5 virtual table named <table>_fts whose rowid mirrors the model id.
+#When the table is missing (other databases, or the migration has not been applied) callers fall back to LIKE queries.
+_available = {}
+
+def index_name(model):
+	return model.__tablename__ + '_fts'
+
+def fts_available(index, connection=None):
+	connection = connection or db.engine
+	if connection.engine.dialect.name != 'sqlite':
+		return False
+	key = (str(connection.engine.url), index)
+	if key not in _available:
+		_available[key] = connection.execute(db.text(
+			"SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name"), name=index).scalar() > 0
+	return _available[key]
+
+def match_expression(expression):
+	#Quote every word so user input can't inject FTS syntax, and make each one a prefix match
+	words = re.findall(r'\w+', expression or '')
+	return ' '.join('"{}"*'.format(word) for word in words)
+
+def add_to_index(connection, index, model):
+	if not fts_available(index, connection):
+		return
+	fields = model.__searchable__
+	remove_from_index(connection, index, model)
+	connection.execute(db.text('INSERT INTO {}(rowid, {}) VALUES (:rowid, {})'.format(
+		index, ', '.join(fields), ', '.join(':' + field for field in fields))),
+		rowid=model.id, **{field: getattr(model, field) for field in fields})
+
+def remove_from_index(connection, index, model):
+	if not fts_available(index, connection):
+		return
+	connection.execute(db.text('DELETE FROM {} WHERE rowid = :rowid'.format(index)), rowid=model.id)
+
+def query_index(index, expression, page, per_page):
+	#Returns the ids of one page of matches ordered by bm25 rank, plus the total number of matches
+	match = match_expression(expression)
+	if not match:
+		return [], 0
+	ids = [row[0] for row in db.session.execute(db.text(
+		'SELECT rowid FROM {0} WHERE {0} MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset'.format(index)),
+		{'match': match, 'limit': per_page, 'offset': (page - 1) * per_page})]
+	total = db.session.execute(db.text(
+		'SELECT count(*) FROM {0} WHERE {0} MATCH :match'.format(index)), {'match': match}).scalar()
+	return ids, total
+
+def create_index(connection, model):
+	#Builds the FTS5 table for a fresh database, the migration does the same for existing ones
+	index = index_name(model)
+	fields = ', '.join(model.__searchable__)
+	connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5({}, prefix='2 3')".format(index, fields))
+	connection.execute('INSERT INTO {0}(rowid, {1}) SELECT id, {1} FROM {2}'.format(index, fields, model.__tablename__))
+	_available.pop((str(connection.engine.url), index), None)
+
+def add_rows_to_index(connection, model, ids):
+	#Indexes rows written with Core statements, which the flush hooks never see
+	index = index_name(model)
+	if not ids or not fts_available(index, connection):
+		return
+	fields = ', '.join(model.__searchable__)
+	connection.execute(db.text('INSERT INTO {0}(rowid, {1}) SELECT id, {1} FROM {2} WHERE id IN :ids'.format(
+		index, fields, model.__tablename__)).bindparams(db.bindparam('ids', expanding=True)), ids=list(ids))
@@ -0,0 +1,56 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from time import monotonic
+
+class TagIndex(object):
+	#Sorted in-memory list of tag names with usage counts, answering prefix lookups with a bisect.
+	#Built from the database on first use, updated as listings are tagged and rebuilt every
+	#TAG_INDEX_REFRESH seconds to pick up tags added by other worker processes.
+	def __init__(self, app=None, load=None):
+		self.lock = threading.Lock()
+		self.names = []
+		self.counts = {}
+		self.built = None
+		self.load = load
+		self.refresh = 300
+		if app is not None:
+			self.init_app(app, load)
+
+	def init_app(self, app, load=None):
+		self.load = load or self.load
+		self.refresh = app.config.get('TAG_INDEX_REFRESH', 300)
+
+	def loader(self, load):
+		#Registers the function returning (tag, usage count) rows, like LoginManager.user_loader
+		self.load = load
+		return load
+
+	def rebuild(self):
+		counts = dict(self.load())
+		with self.lock:
+			self.counts = counts
+			self.names = sorted(counts)
+			self.built = monotonic()
+
+	def update(self, changes):
+		#changes is a list of (tag, delta) pairs
+		with self.lock:
+			if self.built is None:
+				return
+			for name, delta in changes:
+				if name not in self.counts:
+					insort(self.names, name)
+					self.counts[name] = 0
+				self.counts[name] = max(0, self.counts[name] + delta)
+
+	def suggest(self, prefix, limit=10):
+		if self.built is None or monotonic() - self.built > self.refresh:
+			self.rebuild()
+		with self.lock:
+			start = bisect_left(self.names, prefix)
+			end = bisect_left(self.names, prefix + '\uffff') if prefix else len(self.names)
+			matches = self.names[start:end]
+			counts = self.counts
+			best = heapq.nsmallest(limit, matches, key=lambda name: (-counts[name], name))
+			return [(name, counts[name]) for name in best]
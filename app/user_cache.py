@@ -0,0 +1,86 @@
+from time import monotonic, time
+from flask import session, has_request_context
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from app.lru import BoundedLRU
+
+class UserCache(object):
+	#Bounded, TTL limited cache of the identity columns the user loader needs, so requests that only
+	#check who is logged in (notification polls especially) skip the SELECT. A hit rebuilds the user
+	#in the session without a query; columns left out of the cache load lazily on first access.
+	#Committed changes to watched columns drop the entry in this process and bump a version stamp in
+	#the user's session cookie, which makes entries cached by other worker processes miss as well.
+	def __init__(self, app=None, db=None):
+		self.db = db
+		self.entries = BoundedLRU()
+		self.ttl = 60
+		self.model = None
+		if app is not None:
+			self.init_app(app, db)
+
+	def init_app(self, app, db=None):
+		self.db = db or self.db
+		self.entries.max_size = app.config.get('USER_CACHE_SIZE', 1024)
+		self.ttl = app.config.get('USER_CACHE_TTL', 60)
+		self.db.event.listen(self.db.session, 'before_flush', self.collect_changes)
+		self.db.event.listen(self.db.session, 'after_commit', self.apply_changes)
+		self.db.event.listen(self.db.session, 'after_soft_rollback', self.discard_changes)
+
+	def cache(self, model, fields, watch=()):
+		#fields are the columns kept in memory, changes to them or to watch invalidate the entry
+		self.model = model
+		self.fields = list(fields)
+		self.watched = self.fields + list(watch)
+
+	def version(self):
+		return session.get('user_version', 0) if has_request_context() else 0
+
+	def get(self, id):
+		if not self.entries.max_size or not self.ttl:
+			return self.model.query.get(id)
+		db_session = self.db.session
+		key = identity_key(self.model, id)
+		if key in db_session.identity_map:
+			return db_session.identity_map[key]
+		version = self.version()
+		entry = self.entries.get(id, lambda entry: entry[0] > monotonic() and entry[1] == version)
+		if entry is None:
+			user = self.model.query.get(id)
+			if user is not None:
+				self.store(id, version, user)
+			return user
+		user = self.model(**entry[2])
+		make_transient_to_detached(user)
+		db_session.add(user)
+		return user
+
+	def store(self, id, version, user):
+		values = {field: getattr(user, field) for field in self.fields}
+		self.entries.put(id, (monotonic() + self.ttl, version, values))
+
+	def invalidate(self, id):
+		self.entries.pop(id)
+
+	def collect_changes(self, db_session, flush_context, instances):
+		for obj in db_session.dirty:
+			if isinstance(obj, self.model):
+				state = self.db.inspect(obj)
+				if any(state.attrs[field].history.has_changes() for field in self.watched):
+					db_session.info.setdefault('user_cache_changes', set()).add(obj.id)
+
+	def apply_changes(self, db_session):
+		changed = db_session.info.pop('user_cache_changes', ())
+		for id in changed:
+			self.invalidate(id)
+		#The stamp travels with the user's own requests, the only ones that load them as current_user
+		if changed and has_request_context():
+			session['user_version'] = int(time() * 1000)
+
+	def discard_changes(self, db_session, previous_transaction):
+		db_session.info.pop('user_cache_changes', None)
+
+	def clear(self):
+		self.entries.clear()
+
+	def stats(self):
+		return self.entries.stats()
@@ -0,0 +1,38 @@
+"""listing full text search index
+
+Revision ID: 3b8e1f0c2d47
+Revises: a694b16cf070
+Create Date: 2026-10-18 10:12:31.502114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e1f0c2d47'
+down_revision = 'a694b16cf070'
+branch_labels = None
+depends_on = None
+
+
+def fts5_supported(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def upgrade():
+    # Databases without FTS5 keep using the LIKE fallback in SearchableMixin.search
+    bind = op.get_bind()
+    if not fts5_supported(bind):
+        return
+    op.execute("CREATE VIRTUAL TABLE listing_fts USING fts5(title, body, prefix='2 3')")
+    op.execute("INSERT INTO listing_fts(rowid, title, body) SELECT id, title, body FROM listing")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS listing_fts")
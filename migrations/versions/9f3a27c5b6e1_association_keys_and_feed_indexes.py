@@ -0,0 +1,56 @@
+"""association keys and feed indexes
+
+Revision ID: 9f3a27c5b6e1
+Revises: e8b4c1d07a26
+Create Date: 2026-10-18 14:41:52.117604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3a27c5b6e1'
+down_revision = 'e8b4c1d07a26'
+branch_labels = None
+depends_on = None
+
+
+association_tables = [
+    ('listing_user_assoc', 'user_id', 'user.id'),
+    ('listing_interested_user_assoc', 'user_id', 'user.id'),
+    ('listing_tag_assoc', 'tag_id', 'listing_tag.id'),
+]
+
+
+def rebuild_association(name, column, target, primary_key):
+    # SQLite can't add a primary key in place, so copy the distinct pairs into a new table
+    keys = [sa.PrimaryKeyConstraint('listing_id', column)] if primary_key else []
+    op.create_table('_' + name,
+    sa.Column('listing_id', sa.Integer(), nullable=not primary_key),
+    sa.Column(column, sa.Integer(), nullable=not primary_key),
+    sa.ForeignKeyConstraint(['listing_id'], ['listing.id'], ),
+    sa.ForeignKeyConstraint([column], [target], ),
+    *keys
+    )
+    op.execute('INSERT INTO _{0} (listing_id, {1}) SELECT DISTINCT listing_id, {1} FROM {0} '
+               'WHERE listing_id IS NOT NULL AND {1} IS NOT NULL'.format(name, column))
+    op.drop_table(name)
+    op.rename_table('_' + name, name)
+
+
+def upgrade():
+    for name, column, target in association_tables:
+        rebuild_association(name, column, target, True)
+        # reverse direction lookups (a user's listings, a tag's listings) covered without the table
+        op.create_index('ix_{}_{}_listing_id'.format(name, column), name, [column, 'listing_id'], unique=False)
+    op.create_index('ix_listing_is_complete_timestamp', 'listing', ['is_complete', 'timestamp'], unique=False)
+    op.create_index('ix_message_recipient_id_timestamp', 'message', ['recipient_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_message_recipient_id_timestamp', table_name='message')
+    op.drop_index('ix_listing_is_complete_timestamp', table_name='listing')
+    for name, column, target in association_tables:
+        op.drop_index('ix_{}_{}_listing_id'.format(name, column), table_name=name)
+        rebuild_association(name, column, target, False)
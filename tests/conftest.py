@@ -0,0 +1,58 @@
+import os
+import tempfile
+from contextlib import contextmanager
+import pytest
+
+#The app reads its configuration at import time, so point it at a scratch database first
+_fd, DATABASE = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ['JOBS_SYNCHRONOUS'] = 'on'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+
+from sqlalchemy import event
+from app import app as flask_app, db, fragment_cache, tag_index, user_cache
+from app.models import User
+
+@pytest.fixture
+def app():
+	flask_app.config['TESTING'] = True
+	flask_app.config['WTF_CSRF_ENABLED'] = False
+	with flask_app.app_context():
+		db.drop_all()
+		db.create_all()
+	fragment_cache.clear()
+	user_cache.clear()
+	tag_index.built = None
+	yield flask_app
+	with flask_app.app_context():
+		db.session.remove()
+
+@pytest.fixture
+def client(app):
+	return app.test_client()
+
+def make_user(username):
+	user = User(username=username, email=username + '@example.com')
+	user.set_password('password')
+	db.session.add(user)
+	return user
+
+def login(client, username):
+	return client.post('/login', data={'email': username + '@example.com', 'password': 'password'})
+
+@contextmanager
+def count_statements():
+	statements = []
+	def count(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+	event.listen(db.engine, 'before_cursor_execute', count)
+	try:
+		yield statements
+	finally:
+		event.remove(db.engine, 'before_cursor_execute', count)
+
+def pytest_sessionfinish(session, exitstatus):
+	if os.path.exists(DATABASE):
+		os.remove(DATABASE)
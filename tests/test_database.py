@@ -0,0 +1,16 @@
+import os
+import tempfile
+from sqlalchemy import create_engine
+from app import db
+
+def test_profile_applies_to_the_app_engine_only(app):
+	with app.app_context():
+		assert db.session.execute('PRAGMA cache_size').scalar() == app.config['SQLITE_CACHE_SIZE']
+	fd, path = tempfile.mkstemp(suffix='.db')
+	os.close(fd)
+	engine = create_engine('sqlite:///' + path)
+	try:
+		assert engine.execute('PRAGMA cache_size').scalar() != app.config['SQLITE_CACHE_SIZE']
+	finally:
+		engine.dispose()
+		os.remove(path)
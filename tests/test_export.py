@@ -0,0 +1,43 @@
+import json
+from sqlalchemy import event
+from app import app, db
+from app.models import Listing
+from app.export import ndjson
+from conftest import make_user
+
+def test_export_holds_no_connection_between_batches(app):
+	with app.app_context():
+		owner = make_user('owner')
+		for i in range(5):
+			db.session.add(Listing(title='Project {}'.format(i), body='body', owner=owner))
+		db.session.commit()
+		checked_out = []
+		def checkout(*args):
+			checked_out.append(1)
+		def checkin(*args):
+			checked_out.pop()
+		event.listen(db.engine, 'checkout', checkout)
+		event.listen(db.engine, 'checkin', checkin)
+		try:
+			lines = []
+			for chunk in ndjson('listings', batch_size=2):
+				#A slow client reads here, so the batch's transaction and connection must be gone
+				assert not checked_out
+				lines.extend(chunk.splitlines())
+		finally:
+			event.remove(db.engine, 'checkout', checkout)
+			event.remove(db.engine, 'checkin', checkin)
+	assert [json.loads(line)['title'] for line in lines] == ['Project {}'.format(i) for i in range(5)]
+
+def test_export_endpoint_streams_ndjson(client, monkeypatch):
+	monkeypatch.setitem(app.config, 'EXPORT_TOKEN', 'secret')
+	monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 2)
+	with app.app_context():
+		owner = make_user('owner')
+		for i in range(3):
+			db.session.add(Listing(title='Project {}'.format(i), body='body', owner=owner))
+		db.session.commit()
+	assert client.get('/export/listings').status_code == 403
+	response = client.get('/export/listings?after=1', headers={'Authorization': 'Bearer secret'})
+	assert response.mimetype == 'application/x-ndjson'
+	assert [json.loads(line)['id'] for line in response.data.decode().splitlines()] == [2, 3]
@@ -0,0 +1,44 @@
+import json
+from app import db
+from app.models import Listing
+from app.importer import run_import
+from conftest import make_user, count_statements
+
+def test_imported_listings_get_their_own_members_and_tags(app, tmp_path):
+	path = tmp_path / 'listings.jsonl'
+	with app.app_context():
+		for i in range(3):
+			make_user('owner{}'.format(i))
+		db.session.commit()
+		with open(str(path), 'w') as f:
+			for i in range(30):
+				f.write(json.dumps({'type': 'listing', 'owner': 'owner{}'.format(i % 3), 'title': 'Project {}'.format(i),
+					'body': 'body', 'desired_size': 3, 'tags': ['tag{}'.format(i)]}) + '\n')
+		totals = run_import(str(path), chunk_size=7, echo=lambda message: None)
+		assert totals['listings'] == 30
+		for i in range(30):
+			listing = Listing.query.filter_by(title='Project {}'.format(i)).one()
+			assert listing.owner.username == 'owner{}'.format(i % 3)
+			assert [member.username for member in listing.members] == [listing.owner.username]
+			assert [tag.tag for tag in listing.tags] == ['tag{}'.format(i)]
+
+def import_statements(path, titles, tag):
+	with open(str(path), 'w') as f:
+		for title in titles:
+			f.write(json.dumps({'type': 'listing', 'owner': 'owner', 'title': title, 'body': 'body',
+				'desired_size': 3, 'tags': [tag]}) + '\n')
+	with count_statements() as statements:
+		totals = run_import(str(path), chunk_size=100, echo=lambda message: None)
+	assert totals['listings'] == len(titles)
+	return len(statements)
+
+def test_listing_chunks_are_written_with_a_constant_number_of_statements(app, tmp_path):
+	with app.app_context():
+		make_user('owner')
+		db.session.commit()
+		small = import_statements(tmp_path / 'small.jsonl', ['Small {}'.format(i) for i in range(5)], 'small')
+		large = import_statements(tmp_path / 'large.jsonl', ['Large {}'.format(i) for i in range(50)], 'large')
+		assert small == large
+		ids = [listing.id for listing in Listing.query.filter(Listing.title.like('Large %')).order_by(Listing.id)]
+		assert [Listing.query.get(id).title for id in ids] == ['Large {}'.format(i) for i in range(50)]
+		assert all(listing.tags[0].tag == 'large' for listing in Listing.query.filter(Listing.title.like('Large %')))
@@ -0,0 +1,90 @@
+import sys
+import pytest
+from app import app, db, jobs
+from app.models import User, Listing, Message, Job
+from conftest import make_user, login, count_statements
+
+@pytest.fixture
+def clock(monkeypatch):
+	#Job times are plain floats from the module's time(), so a fake clock makes backoff exact.
+	#app.jobs is the queue instance on the package, hence the lookup in sys.modules.
+	now = [1000.0]
+	monkeypatch.setattr(sys.modules['app.jobs'], 'time', lambda: now[0])
+	return now
+
+def ask_to_join(client):
+	with app.app_context():
+		owner = make_user('owner')
+		make_user('joiner')
+		listing = Listing(title='Project', body='body', owner=owner)
+		listing.members.append(owner)
+		db.session.add(listing)
+		db.session.commit()
+		listing_id = listing.id
+	login(client, 'joiner')
+	client.post('/view_listing/{}'.format(listing_id), data={'join_project': 'y'})
+
+def test_synchronous_jobs_deliver_inline(client):
+	assert app.config['JOBS_SYNCHRONOUS']
+	ask_to_join(client)
+	with app.app_context():
+		owner = User.query.filter_by(username='owner').first()
+		assert [message.body for message in owner.messages_received] == \
+			['joiner would like to join: Project please view the listing to accept']
+		assert owner.unread_count == 1
+		assert Job.query.count() == 0
+
+def test_enqueued_jobs_wait_in_the_outbox_until_drained(client, monkeypatch):
+	monkeypatch.setitem(app.config, 'JOBS_SYNCHRONOUS', False)
+	monkeypatch.setattr(jobs, 'workers', 0)
+	ask_to_join(client)
+	with app.app_context():
+		assert Message.query.count() == 0
+		assert jobs.stats() == {'pending': 1, 'running': 0, 'dead': 0}
+		assert jobs.drain() == 1
+		assert Job.query.count() == 0
+		assert User.query.filter_by(username='owner').first().unread_count == 1
+
+def test_failing_jobs_back_off_then_move_to_dead(app, monkeypatch, clock):
+	monkeypatch.setitem(app.config, 'JOBS_SYNCHRONOUS', False)
+	monkeypatch.setattr(jobs, 'max_attempts', 3)
+	monkeypatch.setattr(jobs, 'retry_delay', 10)
+	calls = []
+	def flaky(n):
+		calls.append(n)
+		raise RuntimeError('unavailable')
+	monkeypatch.setitem(jobs.handlers, 'flaky', flaky)
+	with app.app_context():
+		jobs.enqueue('flaky', n=1)
+		db.session.commit()
+		for attempts, delay in ((1, 10), (2, 20)):
+			assert jobs.run_batch() == 1
+			job = Job.query.one()
+			assert (job.status, job.attempts, job.claimed_by) == ('pending', attempts, None)
+			assert job.run_after == clock[0] + delay
+			assert 'RuntimeError: unavailable' in job.last_error
+			db.session.commit()
+			#Not due again until the backoff has passed
+			clock[0] += delay - 1
+			assert jobs.run_batch() == 0
+			clock[0] += 1
+		assert jobs.run_batch() == 1
+		job = Job.query.one()
+		assert (job.status, job.attempts) == ('dead', 3)
+		db.session.commit()
+		clock[0] += 1000
+		assert jobs.run_batch() == 0
+		assert calls == [1, 1, 1]
+		assert jobs.retry_dead() == 1
+		assert jobs.stats() == {'pending': 1, 'running': 0, 'dead': 0}
+
+def test_claim_rechecks_that_jobs_are_due_outside_the_batch_subquery(app, monkeypatch):
+	#Under READ COMMITTED a second worker re-evaluates the UPDATE's own WHERE after waiting on the
+	#first worker's row locks, so the due condition has to be there and not only in the subquery
+	monkeypatch.setitem(app.config, 'JOBS_SYNCHRONOUS', False)
+	with app.app_context():
+		with count_statements() as statements:
+			jobs.claim()
+		update = next(statement for statement in statements if statement.startswith('UPDATE job'))
+		outer = update[update.index('AS anon_1)'):]
+		assert 'job.status = ?' in outer and 'job.run_after <= ?' in outer and 'job.claimed_at < ?' in outer
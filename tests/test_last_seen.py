@@ -0,0 +1,52 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from app import db, last_seen
+from app.last_seen import LastSeenBuffer
+from app.models import User
+from conftest import make_user, login
+
+class LockedDatabase(object):
+	metadata = db.metadata
+
+	class engine(object):
+		@staticmethod
+		def begin():
+			raise OperationalError('UPDATE user', {}, sqlite3.OperationalError('database is locked'))
+
+def stale_user(app, username):
+	with app.app_context():
+		user = make_user(username)
+		user.last_seen = datetime.utcnow() - timedelta(days=1)
+		db.session.commit()
+		return user.id
+
+def test_failed_flush_keeps_timestamps_and_the_page_loads(app, client, monkeypatch):
+	user_id = stale_user(app, 'alice')
+	monkeypatch.setattr(last_seen, 'db', LockedDatabase())
+	monkeypatch.setattr(last_seen, 'threshold', 1)
+	login(client, 'alice')
+	try:
+		assert client.get('/index').status_code == 200
+		assert user_id in last_seen.pending
+	finally:
+		last_seen.pending.clear()
+
+def test_timer_flushes_without_further_requests(app):
+	user_id = stale_user(app, 'bob')
+	buffer = LastSeenBuffer(app, db)
+	buffer.interval = 0.05
+	seen = datetime.utcnow()
+	with app.app_context():
+		buffer.record(User.query.get(user_id), seen)
+	try:
+		for _ in range(40):
+			time.sleep(0.05)
+			with app.app_context():
+				if User.query.get(user_id).last_seen == seen:
+					break
+		with app.app_context():
+			assert User.query.get(user_id).last_seen == seen
+	finally:
+		buffer.stop()
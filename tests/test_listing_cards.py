@@ -0,0 +1,59 @@
+from app import app, db, fragment_cache
+from app.models import User, Listing, ListingTag
+from conftest import make_user, login, count_statements
+
+def page_statements(client, url):
+	#Cached cards would hide lazy loads from the template, so render every card from scratch
+	client.get(url)
+	fragment_cache.clear()
+	with count_statements() as statements:
+		response = client.get(url)
+	assert response.status_code == 200
+	return len(statements)
+
+def test_card_pages_issue_constant_statements_for_distinct_owners_and_tags(client):
+	per_page = app.config['LISTINGS_PER_PAGE']
+	with app.app_context():
+		viewer = make_user('viewer')
+		shared = ListingTag.resolve(['shared'])
+		for i in range(per_page):
+			listing = Listing(title='Shared {}'.format(i), body='body', owner=viewer, tags=shared)
+			listing.members.append(viewer)
+			db.session.add(listing)
+		db.session.commit()
+	login(client, 'viewer')
+	single = [page_statements(client, '/index'), page_statements(client, '/user/viewer')]
+
+	with app.app_context():
+		viewer = User.query.filter_by(username='viewer').first()
+		for i in range(per_page):
+			owner = make_user('owner{}'.format(i))
+			listing = Listing(title='Distinct {}'.format(i), body='body', owner=owner,
+				tags=ListingTag.resolve(['tag{}'.format(i), 'extra{}'.format(i)]))
+			listing.members.append(owner)
+			listing.members.append(viewer)
+			db.session.add(listing)
+		db.session.commit()
+	index = page_statements(client, '/index')
+	profile = page_statements(client, '/user/viewer')
+	assert b'Distinct' in client.get('/index').data
+	assert [index, profile] == single
+
+def test_deleted_listing_card_is_not_shown_for_a_reused_id(client):
+	with app.app_context():
+		owner = make_user('owner')
+		for title in ('Paper', 'Scissors'):
+			listing = Listing(title=title, body='body', owner=owner)
+			listing.members.append(owner)
+			db.session.add(listing)
+		db.session.commit()
+		deleted_id = Listing.query.filter_by(title='Scissors').first().id
+	login(client, 'owner')
+	assert b'Scissors' in client.get('/index').data
+	client.post('/view_listing/{}'.format(deleted_id), data={'delete_project': 'y'})
+	client.post('/create_listing', data={'title': 'Brand new', 'body': 'body', 'desired_size': 2, 'tags': ''})
+	with app.app_context():
+		assert Listing.query.filter_by(title='Brand new').first().id == deleted_id
+	page = client.get('/index').data
+	assert b'Brand new' in page
+	assert b'Scissors' not in page
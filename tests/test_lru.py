@@ -0,0 +1,20 @@
+from app.lru import BoundedLRU
+
+def test_least_recently_used_entries_are_dropped_first():
+	lru = BoundedLRU(max_size=2)
+	lru.put('a', 1)
+	lru.put('b', 2)
+	assert lru.get('a') == 1
+	lru.put('c', 3)
+	assert lru.get('b') is None
+	assert (lru.get('a'), lru.get('c')) == (1, 3)
+	assert lru.stats() == {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1, 'hit_rate': 0.75}
+
+def test_rejected_entries_count_as_misses():
+	lru = BoundedLRU()
+	lru.put('card', (1, 'html'))
+	assert lru.get('card', lambda entry: entry[0] == 2) is None
+	assert lru.get('card', lambda entry: entry[0] == 1) == (1, 'html')
+	assert lru.pop('card') == (1, 'html')
+	assert lru.stats()['size'] == 0
+	assert (lru.stats()['hits'], lru.stats()['misses']) == (1, 1)
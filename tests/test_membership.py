@@ -0,0 +1,51 @@
+from app import app, db, tag_index
+from app.models import User, Listing, ListingTag
+from app.models import listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc
+from conftest import make_user, login, count_statements
+
+def delete_statements(client, title, members, interested):
+	with app.app_context():
+		owner = User.query.filter_by(username='owner').first()
+		listing = Listing(title=title, body='body', owner=owner, tags=ListingTag.resolve(['python']))
+		listing.members.append(owner)
+		for i in range(members):
+			listing.members.append(make_user('{}-member{}'.format(title, i)))
+		for i in range(interested):
+			listing.interested_users.append(make_user('{}-interested{}'.format(title, i)))
+		db.session.add(listing)
+		db.session.commit()
+		listing_id = listing.id
+		User.query.update({User.recommendations_stale: False})
+		db.session.commit()
+	#Warm the user cache so both deletes load the owner the same way
+	client.get('/index')
+	with count_statements() as statements:
+		client.post('/view_listing/{}'.format(listing_id), data={'delete_project': 'y'})
+	with app.app_context():
+		assert Listing.query.get(listing_id) is None
+		for table in (listing_user_assoc, listing_interested_user_assoc, listing_tag_assoc):
+			assert db.session.query(table).filter(table.c.listing_id == listing_id).count() == 0
+		assert User.query.filter(User.username.like(title + '-%'), User.recommendations_stale == False).count() == 0
+	return statements
+
+def test_deleting_a_listing_does_not_load_its_members_or_join_requests(client):
+	with app.app_context():
+		make_user('owner')
+		db.session.commit()
+	login(client, 'owner')
+	small = delete_statements(client, 'small', 1, 1)
+	large = delete_statements(client, 'large', 10, 30)
+	assert len(small) == len(large)
+	assert not [statement for statement in large if statement.startswith('SELECT user.')
+		and 'listing_interested_user_assoc' in statement]
+
+def test_deleted_listing_tags_leave_the_suggestion_index(client):
+	with app.app_context():
+		make_user('owner')
+		db.session.commit()
+	login(client, 'owner')
+	with app.app_context():
+		tag_index.rebuild()
+	delete_statements(client, 'tagged', 0, 0)
+	with app.app_context():
+		assert tag_index.suggest('pyth') == [('python', 0)]
@@ -0,0 +1,67 @@
+import os
+import re
+import tempfile
+from sqlalchemy import create_engine, event
+from app import app, db, request_metrics
+from conftest import make_user, login, count_statements
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?[0-9.e+-]+$')
+
+def logged_in(client):
+	with app.app_context():
+		make_user('viewer')
+		db.session.commit()
+	login(client, 'viewer')
+	return client
+
+def samples(text, name):
+	return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+		for line in text.splitlines() if line.startswith(name + '{') or line.startswith(name + ' ')}
+
+def test_server_timing_header_reports_the_request_statements(client):
+	logged_in(client).get('/index')
+	with count_statements() as statements:
+		response = client.get('/index')
+	timing = re.match(r'^app;dur=(\d+\.\d\d), db;dur=(\d+\.\d\d);desc="(\d+) queries"$',
+		response.headers['Server-Timing'])
+	assert timing
+	assert int(timing.group(3)) == len(statements)
+	assert float(timing.group(2)) <= float(timing.group(1))
+
+def test_metrics_are_served_in_the_prometheus_text_format(client):
+	logged_in(client)
+	before = samples(client.get('/metrics').data.decode(), 'collabnow_requests_total')
+	for _ in range(3):
+		client.get('/index')
+	response = client.get('/metrics')
+	assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+	text = response.data.decode()
+	for line in text.splitlines():
+		assert line.startswith(('# HELP ', '# TYPE ')) or SAMPLE.match(line), line
+	assert '# TYPE collabnow_requests_total counter' in text
+	assert '# TYPE collabnow_request_duration_seconds histogram' in text
+	key = 'collabnow_requests_total{endpoint="index",method="GET",status="200"}'
+	assert samples(text, 'collabnow_requests_total')[key] == before.get(key, 0) + 3
+	buckets = [value for name, value in samples(text, 'collabnow_request_duration_seconds_bucket').items()
+		if 'endpoint="index"' in name]
+	assert buckets == sorted(buckets)
+	assert buckets[-1] == samples(text, 'collabnow_request_duration_seconds_count')[
+		'collabnow_request_duration_seconds_count{endpoint="index"}']
+	assert 'collabnow_fragment_cache_hit_rate' in samples(text, 'collabnow_fragment_cache_hit_rate')
+
+def test_query_budget_overruns_are_logged(client, monkeypatch, caplog):
+	monkeypatch.setitem(request_metrics.budgets, 'index', 1)
+	logged_in(client).get('/index')
+	assert any('over its budget of 1' in record.getMessage() for record in caplog.records)
+
+def test_only_the_app_engine_is_instrumented(app):
+	with app.app_context():
+		assert event.contains(db.engine, 'before_cursor_execute', request_metrics.before_cursor_execute)
+	fd, path = tempfile.mkstemp(suffix='.db')
+	os.close(fd)
+	engine = create_engine('sqlite:///' + path)
+	try:
+		assert not event.contains(engine, 'before_cursor_execute', request_metrics.before_cursor_execute)
+	finally:
+		engine.dispose()
+		os.remove(path)
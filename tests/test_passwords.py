@@ -0,0 +1,27 @@
+import time
+import pytest
+from app.passwords import PasswordHasher, HashingUnavailable
+
+@pytest.fixture
+def hasher():
+	hasher = PasswordHasher()
+	hasher.configure({'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', 'PASSWORD_HASH_WORKERS': 1,
+		'PASSWORD_HASH_QUEUE': 0, 'PASSWORD_HASH_TIMEOUT': 0.5})
+	yield hasher
+	hasher.shutdown()
+
+def test_pool_hashes_and_checks(hasher):
+	password_hash = hasher.generate('secret')
+	assert hasher.check(password_hash, 'secret')
+	assert not hasher.check(password_hash, 'wrong')
+	assert hasher.executor._mp_context.get_start_method() != 'fork'
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(hasher):
+	hasher.generate('warm up the pool')
+	with pytest.raises(HashingUnavailable):
+		hasher.run(time.sleep, 3)
+	#The sleeping worker still holds the only slot
+	with pytest.raises(HashingUnavailable):
+		hasher.run(time.sleep, 0)
+	time.sleep(3)
+	assert hasher.run(time.sleep, 0) is None
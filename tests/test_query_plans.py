@@ -0,0 +1,36 @@
+from app import db
+from app.models import Listing, Message, listing_user_assoc
+from conftest import make_user
+
+def query_plan(query):
+	statement = getattr(query, 'statement', query)
+	sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+	return [row[-1] for row in db.session.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+def test_membership_exists_searches_the_association_primary_key(app):
+	with app.app_context():
+		plan = query_plan(db.session.query(db.exists().where(db.and_(
+			listing_user_assoc.c.listing_id == 1, listing_user_assoc.c.user_id == 2))))
+		assert any(line.startswith('SEARCH listing_user_assoc USING COVERING INDEX') for line in plan), plan
+
+def test_listings_by_member_use_the_reverse_index(app):
+	with app.app_context():
+		user = make_user('member')
+		db.session.commit()
+		plan = query_plan(user.joined_listings())
+		assert any('listing_user_assoc USING COVERING INDEX ix_listing_user_assoc_user_id_listing_id' in line
+			for line in plan), plan
+
+def test_feed_walks_the_is_complete_timestamp_index(app):
+	with app.app_context():
+		plan = query_plan(Listing.query.filter_by(is_complete=False).order_by(Listing.timestamp.desc()).limit(6))
+		assert any(line.startswith('SEARCH listing USING INDEX ix_listing_is_complete_timestamp') for line in plan), plan
+		assert not any('TEMP B-TREE' in line for line in plan), plan
+
+def test_inbox_walks_the_recipient_timestamp_index(app):
+	with app.app_context():
+		user = make_user('recipient')
+		db.session.commit()
+		plan = query_plan(user.messages_received.order_by(Message.timestamp.desc()).limit(6))
+		assert any(line.startswith('SEARCH message USING INDEX ix_message_recipient_id_timestamp') for line in plan), plan
+		assert not any('TEMP B-TREE' in line for line in plan), plan
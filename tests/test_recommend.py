@@ -0,0 +1,69 @@
+import numpy as np
+from app import app, db
+from app.models import User, Listing, ListingTag, Recommendation
+from app.recommend import listing_tags, score_batch, rebuild
+from conftest import make_user, login
+
+def seed():
+	alice = make_user('alice')
+	bob = make_user('bob')
+	owner = make_user('owner')
+	for title, tags, members in (('Joined', ['python', 'flask'], [alice]), ('Other', ['rust'], [bob]),
+			('Python web', ['python', 'flask', 'web'], []), ('Python data', ['python', 'numpy'], []),
+			('Rust cli', ['rust', 'cli'], []), ('Untagged', [], [])):
+		listing = Listing(title=title, body='body', owner=owner, tags=ListingTag.resolve(tags))
+		listing.members.extend([owner] + members)
+		db.session.add(listing)
+	db.session.commit()
+
+def dense_matrix(listings):
+	#Reference: the full listings x tags matrix the chunked scorer avoids building
+	matrix = np.zeros((len(listings), len(listings.tag_columns)), dtype=np.float32)
+	for row in range(len(listings)):
+		matrix[row, listings.indices[listings.indptr[row]:listings.indptr[row + 1]]] = 1.0
+	matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+	return matrix
+
+def test_chunked_scores_match_for_any_chunk_size(app):
+	with app.app_context():
+		seed()
+		user_ids = [user.id for user in User.query.order_by(User.id)]
+		listings = listing_tags()
+		assert len(listings) == 5
+		expected = score_batch(user_ids, listings, 3, chunk_size=len(listings))
+		for chunk_size in (1, 2, 4):
+			rows = score_batch(user_ids, listings, 3, chunk_size=chunk_size)
+			assert [(row['user_id'], row['listing_id'], row['rank']) for row in rows] == \
+				[(row['user_id'], row['listing_id'], row['rank']) for row in expected]
+			assert np.allclose([row['score'] for row in rows], [row['score'] for row in expected])
+		matrix = dense_matrix(listings)
+		alice = User.query.filter_by(username='alice').first()
+		joined = Listing.query.filter_by(title='Joined').first()
+		profile = matrix[list(listings.ids).index(joined.id)]
+		for row in expected:
+			if row['user_id'] == alice.id:
+				column = list(listings.ids).index(row['listing_id'])
+				assert np.isclose(row['score'], matrix[column] @ profile)
+
+def test_recommendations_exclude_own_listings_and_rank_by_similarity(app):
+	with app.app_context():
+		seed()
+		rebuild(everyone=True)
+		alice = User.query.filter_by(username='alice').first()
+		titles = [Listing.query.get(rec.listing_id).title
+			for rec in Recommendation.query.filter_by(user_id=alice.id).order_by(Recommendation.rank)]
+		assert titles == ['Python web', 'Python data']
+		owner = User.query.filter_by(username='owner').first()
+		assert Recommendation.query.filter_by(user_id=owner.id).count() == 0
+
+def test_deleting_a_listing_deletes_its_recommendations(client):
+	with app.app_context():
+		seed()
+		rebuild(everyone=True)
+		listing_id = Listing.query.filter_by(title='Python web').first().id
+		assert Recommendation.query.filter_by(listing_id=listing_id).count()
+	login(client, 'owner')
+	client.post('/view_listing/{}'.format(listing_id), data={'delete_project': 'y'})
+	with app.app_context():
+		assert Listing.query.get(listing_id) is None
+		assert Recommendation.query.filter_by(listing_id=listing_id).count() == 0
@@ -0,0 +1,75 @@
+import pytest
+from app import app, db
+from app.models import Listing
+from app.search import create_index, index_name, fts_available, _available
+from conftest import make_user, login
+
+@pytest.fixture
+def fts(app):
+	#create_all doesn't know the virtual table, so build it here and drop it for the next test
+	with app.app_context():
+		create_index(db.engine, Listing)
+	yield
+	with app.app_context():
+		db.engine.execute('DROP TABLE IF EXISTS {}'.format(index_name(Listing)))
+	_available.clear()
+
+def indexed_ids(expression):
+	return [id for id, in db.session.execute('SELECT rowid FROM listing_fts WHERE listing_fts MATCH :match',
+		{'match': expression})]
+
+def titles(page):
+	return [listing.title for listing in page.items]
+
+def seed():
+	owner = make_user('owner')
+	for title, body in (('Quantum computing', 'Qubits, quantum gates and quantum error correction'),
+			('Chamber music', 'A string quartet that once played at a quantum physics conference dinner'),
+			('Gardening club', 'Tomatoes and herbs')):
+		listing = Listing(title=title, body=body, owner=owner)
+		listing.members.append(owner)
+		db.session.add(listing)
+	db.session.commit()
+
+def test_listings_are_indexed_on_create_update_and_delete(client, fts):
+	with app.app_context():
+		seed()
+		listing = Listing.query.filter_by(title='Gardening club').one()
+		listing_id = listing.id
+		assert indexed_ids('tomatoes') == [listing_id]
+		listing.body = 'Roses and orchids'
+		db.session.commit()
+		assert indexed_ids('tomatoes') == []
+		assert indexed_ids('orchids') == [listing_id]
+		listing.title = 'Flower club'
+		db.session.commit()
+		assert indexed_ids('flower') == [listing_id]
+	login(client, 'owner')
+	client.post('/view_listing/{}'.format(listing_id), data={'delete_project': 'y'})
+	with app.app_context():
+		assert Listing.query.get(listing_id) is None
+		assert indexed_ids('orchids') == []
+
+def test_prefix_matches_are_ranked_and_counted(app, fts):
+	with app.app_context():
+		seed()
+		assert fts_available(index_name(Listing))
+		page = Listing.search('quan', 1, 10)
+		assert titles(page) == ['Quantum computing', 'Chamber music']
+		assert page.total == 2
+		second = Listing.search('quan', 2, 1)
+		assert titles(second) == ['Chamber music']
+		assert (second.total, second.pages, second.has_next, second.has_prev) == (2, 2, False, True)
+		assert Listing.search('quan gates', 1, 10).total == 1
+		#FTS syntax in user input is quoted away rather than raising
+		assert Listing.search('quantum OR "', 1, 10).total == 0
+
+def test_search_falls_back_to_like_without_the_index(app):
+	with app.app_context():
+		seed()
+		assert not fts_available(index_name(Listing))
+		page = Listing.search('music', 1, 10)
+		assert titles(page) == ['Chamber music']
+		assert page.total == 1
+		#LIKE only looks at titles, so a word from a body finds nothing
+		assert Listing.search('tomatoes', 1, 10).total == 0
@@ -0,0 +1,40 @@
+from app import db
+from app.models import User, Listing, ListingTag
+from conftest import make_user, login, count_statements
+
+def add_listings(owner, count, start=0):
+	tags = {name: tag for name, tag in zip(['python', 'rust', 'java'], ListingTag.resolve(['python', 'rust', 'java']))}
+	for i in range(start, start + count):
+		listing = Listing(title='Listing {}'.format(i), body='body', owner=owner)
+		listing.tags = [tags['python'], tags['rust']] if i % 2 else [tags['java']]
+		listing.members.append(owner)
+		db.session.add(listing)
+	db.session.commit()
+
+def tag_filter_statements(client):
+	client.get('/index?tags=python%23rust')
+	with count_statements() as statements:
+		response = client.get('/index?tags=python%23rust')
+	assert response.status_code == 200
+	return len(statements)
+
+def test_tag_filter_statement_count_does_not_depend_on_catalog_size(app, client):
+	with app.app_context():
+		owner = make_user('owner')
+		add_listings(owner, 20)
+	login(client, 'owner')
+	small = tag_filter_statements(client)
+	with app.app_context():
+		owner = User.query.filter_by(username='owner').first()
+		add_listings(owner, 180, start=20)
+	large = tag_filter_statements(client)
+	assert small == large
+
+def test_tag_filter_requires_every_tag(app, client):
+	with app.app_context():
+		owner = make_user('owner')
+		add_listings(owner, 4)
+	login(client, 'owner')
+	response = client.get('/index?tags=python%23rust')
+	assert b'Listing 1' in response.data and b'Listing 3' in response.data
+	assert b'Listing 0' not in response.data and b'Listing 2' not in response.data
@@ -0,0 +1,80 @@
+import re
+import sys
+import pytest
+from werkzeug.security import generate_password_hash
+from app import app, db, user_cache
+from app.models import User
+from conftest import make_user, login, count_statements
+
+@pytest.fixture
+def clock(monkeypatch):
+	#Entry expiry uses the module's monotonic(); app.user_cache is the cache instance on the package
+	now = [1000.0]
+	monkeypatch.setattr(sys.modules['app.user_cache'], 'monotonic', lambda: now[0])
+	return now
+
+def user_selects(client, url):
+	with count_statements() as statements:
+		response = client.get(url)
+	assert response.status_code == 200
+	return [statement for statement in statements if re.search(r'\bFROM user\b', statement)]
+
+def logged_in(client, username='alice'):
+	with app.app_context():
+		make_user(username)
+		db.session.commit()
+		id = User.query.filter_by(username=username).one().id
+	login(client, username)
+	return id
+
+def test_notification_polls_skip_the_user_select(client):
+	id = logged_in(client)
+	assert user_selects(client, '/notifications')
+	assert id in user_cache.entries.entries
+	assert not user_selects(client, '/notifications')
+	assert user_cache.stats()['hits'] >= 1
+
+def test_profile_edits_evict_the_entry(client):
+	id = logged_in(client)
+	client.get('/notifications')
+	assert id in user_cache.entries.entries
+	client.post('/edit_profile', data={'username': 'alicia', 'major': 'Physics', 'about_me': ''})
+	assert id not in user_cache.entries.entries
+	assert b'alicia' in client.get('/user/alicia').data
+
+def test_password_rehash_evicts_the_entry(client):
+	id = logged_in(client)
+	client.get('/notifications')
+	with app.app_context():
+		db.session.execute(User.__table__.update().where(User.id == id).values(
+			password_hash=generate_password_hash('password', method='pbkdf2:sha256:999')))
+		db.session.commit()
+	assert id in user_cache.entries.entries
+	#Logging in from another browser checks the password and upgrades the outdated hash
+	other = app.test_client()
+	login(other, 'alice')
+	assert id not in user_cache.entries.entries
+	with app.app_context():
+		assert User.query.get(id).password_hash.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+
+def test_entries_cached_under_an_older_version_stamp_miss(client):
+	#Another worker process edited the profile: it bumped the stamp in the cookie, this one still
+	#holds the old values under the old stamp
+	id = logged_in(client)
+	client.get('/notifications')
+	expires, version, values = user_cache.entries.entries[id]
+	user_cache.entries.put(id, (expires, version, dict(values, username='stale')))
+	with client.session_transaction() as session:
+		session['user_version'] = version + 1
+	misses = user_cache.stats()['misses']
+	page = client.get('/edit_profile').data
+	assert b'value="alice"' in page and b'stale' not in page
+	assert user_cache.stats()['misses'] == misses + 1
+
+def test_entries_expire_after_the_ttl(client, clock):
+	logged_in(client)
+	client.get('/notifications')
+	clock[0] += user_cache.ttl - 1
+	assert not user_selects(client, '/notifications')
+	clock[0] += 2
+	assert user_selects(client, '/notifications')